@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+'''memory used by a cache of 5,000 articles, before and after being compacted
+
+The old `Article` kept a reference to its full `ads.search.Article` entry (and
+a per-instance `__dict__`). This compares the memory retained by a cache of
+these old articles (a copy of the class is kept below) to a cache of the
+compact (slotted) articles, both built from the same entries.
+
+Run with `python benchmarks/article_memory.py` (requires a papermate config).
+'''
+
+import gc
+import tracemalloc
+
+import ads.search
+
+from papermate.articles import Article
+
+
+N_ARTICLES = 5000
+
+
+def fake_doc(ind, Nauthors=30):
+    '''a document resembling a typical ADS search result'''
+    return {
+        'id': str(ind),
+        'bibcode': f'2024arXiv{ind:09d}',
+        'title': [f'A reasonably long title of article number {ind}'],
+        'author': [f'Author{j}, A. B.' for j in range(Nauthors)],
+        'aff': [f'Department {j}, Some University, Country'
+                for j in range(Nauthors)],
+        'year': '2024', 'pubdate': '2024-05-00',
+        'doi': [f'10.1000/{ind}'], 'bibstem': ['arXiv'], 'bibgroup': None,
+        'identifier': [f'arXiv:2405.{ind:05d}', f'2024arXiv{ind:09d}'],
+        'abstract': 'word ' * 300, 'keyword': ['a', 'b', 'c'],
+        'page': [f'arXiv:2405.{ind:05d}'], 'read_count': 10,
+    }
+
+
+class OldArticle:
+    '''copy of `Article` before it was made compact (fields only)'''
+
+    def __init__(self, entry):
+
+        self._entry = entry
+
+        # bibliographic info
+        self.title = entry.title[0]
+        self._authors = entry.author
+        self.first_author = self._authors[0]
+        self.year = entry.year
+
+        # identifiers
+        self.bibcode = entry.bibcode
+        self._doi = entry.doi if entry.doi is not None else []
+        self.bibstem = entry.bibstem[0]
+        self.bibgroup = entry.bibgroup
+
+        self._identifiers = entry.identifier
+
+        try:
+            self.arxiv_id = [id_ for id_ in self._identifiers
+                             if id_.startswith('arXiv:')][0]
+        except IndexError:
+            self.arxiv_id = None
+
+        # extra frontmatter
+        self.abstract = entry.abstract or "No abstract"
+        self._affiliations = entry.aff
+        self.keywords = entry.keyword
+
+        # analytics
+        self._page = entry.page
+        self.read_count = str(entry.read_count)
+        self.date = entry.pubdate
+
+
+def measure(build):
+    '''the memory (in MB) retained by the objects returned by `build`'''
+
+    gc.collect()
+    tracemalloc.start()
+
+    kept = build()
+    gc.collect()
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del kept
+
+    return current / 1e6
+
+
+def old():
+    return [OldArticle(ads.search.Article(**fake_doc(i)))
+            for i in range(N_ARTICLES)]
+
+
+def compact():
+    return [Article(ads.search.Article(**fake_doc(i)))
+            for i in range(N_ARTICLES)]
+
+
+def main():
+
+    full = measure(old)
+    small = measure(compact)
+
+    print(f'{N_ARTICLES} articles, old:     {full:8.2f} MB')
+    print(f'{N_ARTICLES} articles, compact: {small:8.2f} MB')
+    print(f'saved: {full - small:.2f} MB ({1 - small / full:.0%})')
+
+
+if __name__ == '__main__':
+    main()
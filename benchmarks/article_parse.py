@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''time taken to build articles from a page of raw solr documents
+
+Compares the previous path (an `ads.search.Article` made for every document,
+then wrapped in an `Article`) with building them directly using
+`Article.from_docs`.
+
+Run with `python benchmarks/article_parse.py` (requires a papermate config).
+'''
+
+import copy
+import timeit
+
+import ads.search
+
+from papermate.articles import Article
+from article_memory import fake_doc
+
+
+N_DOCS = 2000
+N_REPEATS = 10
+
+FL = ['id', 'author', 'title', 'year', 'pubdate', 'doi', 'bibcode',
+      'bibstem', 'bibgroup', 'identifier', 'abstract', 'aff', 'keyword',
+      'page', 'read_count']
+
+
+def through_ads(docs):
+    '''the path used by `ads.search.SolrResponse.articles`, then wrapped'''
+
+    entries = []
+
+    for doc in docs:
+        for k in set(FL).difference(doc.keys()):
+            doc[k] = None
+        entries.append(ads.search.Article(**doc))
+
+    return [Article(e) for e in entries]
+
+
+def from_docs(docs):
+    return Article.from_docs(docs)
+
+
+def main():
+
+    docs = [fake_doc(i) for i in range(N_DOCS)]
+
+    for func in (through_ads, from_docs):
+
+        # copy the documents each time, as `through_ads` modifies them
+        times = timeit.repeat(lambda: func(copy.copy(docs)),
+                              number=1, repeat=N_REPEATS)
+
+        print(f'{func.__name__:>12}: {min(times) * 1e3:8.2f} ms '
+              f'per {N_DOCS} documents')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+'''cold-start time of importing papermate, and of first reading the config
+
+Each measurement is made in a fresh interpreter. The config file is only read
+(and logging and the reminder cronjob set up) once a setting is first needed,
+so this cost is no longer paid by simply importing papermate.
+
+Run with `python benchmarks/import_time.py` (requires a papermate config).
+'''
+
+import sys
+import subprocess
+
+
+N_REPEATS = 10
+
+SNIPPET = '''
+import time
+start = time.perf_counter()
+
+import papermate.utils
+imported = time.perf_counter()
+
+papermate.utils.CONFIG.settings
+loaded = time.perf_counter()
+
+print(imported - start, loaded - imported)
+'''
+
+
+def main():
+
+    imports, loads = [], []
+
+    for _ in range(N_REPEATS):
+
+        out = subprocess.run([sys.executable, '-c', SNIPPET], check=True,
+                             capture_output=True, text=True).stdout
+
+        t_import, t_load = map(float, out.split())
+
+        imports.append(t_import)
+        loads.append(t_load)
+
+    print(f'{"import papermate.utils":>24}: {min(imports) * 1e3:8.2f} ms')
+    print(f'{"first config access":>24}: {min(loads) * 1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+'''time taken to download a PDF when some of its sources are slow or broken
+
+Local HTTP servers stand in for the ADS link gateway (EPRINT_PDF and PUB_PDF)
+and arXiv, each with an injected latency (and the gateway optionally giving an
+HTML page rather than a PDF). Downloading from only the first source is
+compared with racing all sources through `race_download`.
+
+Run with `python benchmarks/pdf_race.py` (requires a papermate config).
+'''
+
+import time
+import pathlib
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from papermate.downloads import download_file, race_download
+
+
+PDF = b'%PDF-1.4 ' + b'x' * 2_000_000
+HTML = b'<html>Please wait while we redirect you</html>'
+
+HEDGE_DELAY = 0.5
+
+# source: (latency in seconds, body) for each scenario
+SCENARIOS = {
+    'all fast': {
+        'EPRINT_PDF': (0.05, PDF), 'arXiv': (0.05, PDF), 'PUB_PDF': (0.05, PDF)
+    },
+    'slow gateway': {
+        'EPRINT_PDF': (3.0, PDF), 'arXiv': (0.1, PDF), 'PUB_PDF': (1.0, PDF)
+    },
+    'gateway html': {
+        'EPRINT_PDF': (0.2, HTML), 'arXiv': (0.3, PDF), 'PUB_PDF': (2.0, PDF)
+    },
+}
+
+
+def stand_in(latency, body):
+    '''start a local server which responds to everything with `body`'''
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            time.sleep(latency)
+
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass  # cancelled by the client
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def timed(func, *args, **kwargs):
+
+    start = time.perf_counter()
+
+    try:
+        func(*args, **kwargs)
+        result = 'ok'
+
+    except Exception as err:
+        result = type(err).__name__
+
+    return time.perf_counter() - start, result
+
+
+def main():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        for ind, (name, sources) in enumerate(SCENARIOS.items()):
+
+            servers = [stand_in(*spec) for spec in sources.values()]
+
+            urls = [f'http://127.0.0.1:{srv.server_address[1]}/pdf'
+                    for srv in servers]
+
+            dest = pathlib.Path(tmpdir, f'{ind}_first.pdf')
+            t_first, r_first = timed(download_file, urls[0], dest,
+                                     magic=b'%PDF')
+
+            dest = pathlib.Path(tmpdir, f'{ind}_race.pdf')
+            t_race, r_race = timed(race_download, urls, dest,
+                                   hedge_delay=HEDGE_DELAY)
+
+            print(f'{name:>14}: first source {t_first:6.2f} s ({r_first}), '
+                  f'raced {t_race:6.2f} s ({r_race})')
+
+            for srv in servers:
+                srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+'''time taken to load, query and mark a seen index of many tracked articles
+
+An index of `N_TRACKED` (fake, but correctly sized) bibcodes, all seen and
+every other one read, is written to a temporary folder, and then loaded again,
+as a new session would. Looking up whether each article of a typical day has
+been seen should take well under a millisecond, however many are tracked.
+
+Run with `python benchmarks/seen_index.py` (requires a papermate config).
+'''
+
+import time
+import tempfile
+
+from papermate.seen import SeenIndex
+
+
+N_TRACKED = 100_000
+N_DAY = 200
+
+
+def bibcode(ind):
+    return f'2024arXiv{ind:09d}X'[:19]
+
+
+def main():
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        index = SeenIndex(tmpdir)
+
+        start = time.perf_counter()
+
+        for ind in range(0, N_TRACKED, 2):
+            index.mark_read(bibcode(ind))
+            index.mark_seen(bibcode(ind + 1))
+
+        t_mark = (time.perf_counter() - start) / N_TRACKED
+
+        start = time.perf_counter()
+
+        index = SeenIndex(tmpdir)
+
+        t_load = time.perf_counter() - start
+
+        day = [bibcode(ind) for ind in range(N_TRACKED - N_DAY, N_TRACKED)]
+
+        start = time.perf_counter()
+
+        Nseen = sum(bib in index for bib in day)
+
+        t_lookup = time.perf_counter() - start
+
+        print(f'{len(index)} tracked articles')
+        print(f'{"mark new article":>24}: {t_mark * 1e6:8.2f} us')
+        print(f'{"load index":>24}: {t_load * 1e3:8.2f} ms')
+        print(f'{f"check a day ({N_DAY})":>24}: {t_lookup * 1e3:8.2f} ms '
+              f'({Nseen} seen)')
+
+
+if __name__ == '__main__':
+    main()
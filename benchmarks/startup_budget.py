@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+'''import time of every command line entry point, checked against a budget
+
+Each entry point module is imported in a fresh interpreter with
+`python -X importtime`, and its cumulative import time (the best of a number
+of repeats) compared to its budget below. The slowest imports of any module
+over its budget are listed, and the exit code is non-zero, so that any
+regression (e.g. `ads` being imported eagerly again) is caught.
+
+Run with `python benchmarks/startup_budget.py` (requires a papermate config).
+'''
+
+import sys
+import subprocess
+
+
+N_REPEATS = 5
+
+# module: (entry points, budget in ms)
+BUDGETS = {
+    'papermate.scripts.base': (
+        'papermate, papermate-daily, papermate-library', 30
+    ),
+    'papermate.scripts.config': ('papermate-config', 60),
+    'papermate.scripts.notify': ('papermate-remind', 60),
+    'papermate.scripts.prefetch': ('papermate-prefetch', 60),
+    # everything imported before the interface is first drawn
+    'papermate.interface': ('(first draw)', 80),
+}
+
+
+def importtime(module):
+    '''the cumulative import time (ms) of `module`, and of all its imports'''
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           f'import {module}'],
+                          check=True, capture_output=True, text=True)
+
+    times = {}
+
+    for line in proc.stderr.splitlines():
+
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+
+        times[name.strip()] = int(cumulative) / 1e3
+
+    return times[module], times
+
+
+def main():
+
+    over = []
+
+    for module, (entry_points, budget) in BUDGETS.items():
+
+        runs = [importtime(module) for _ in range(N_REPEATS)]
+
+        best, times = min(runs, key=lambda run: run[0])
+
+        status = 'ok' if best <= budget else 'OVER BUDGET'
+
+        print(f'{module:>28}: {best:8.2f} ms / {budget:4d} ms  {status:<11} '
+              f'[{entry_points}]')
+
+        if best > budget:
+            over.append((module, times))
+
+    for module, times in over:
+
+        print(f'\nslowest imports of {module}:')
+
+        del times[module]
+
+        slowest = sorted(times.items(), key=lambda item: -item[1])
+
+        for name, t in slowest[:10]:
+            print(f'    {name:<40} {t:8.2f} ms')
+
+    sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,27 @@
-from .interface import controller
+import importlib
 
 __version__ = "1.1.0"
+
+
+def __getattr__(name):
+    '''import the interface, and any submodules, only once first needed
+
+    The curses interface (and through it `ads`, `requests`, etc.) is slow to
+    import, and not needed by most of the command line scripts.
+    '''
+
+    if name == 'controller':
+        from .interface import controller
+        return controller
+
+    try:
+        return importlib.import_module(f'.{name}', __name__)
+
+    except ModuleNotFoundError as err:
+
+        # Only if this submodule doesn't exist, not any of its own imports
+        if err.name != f'{__name__}.{name}':
+            raise
+
+        mssg = f"module '{__name__}' has no attribute '{name}'"
+        raise AttributeError(mssg) from None
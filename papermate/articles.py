@@ -1,65 +1,136 @@
-import ads
+import sys
 import logging
+import shutil
+import pathlib
 import textwrap as tw
 
-from .utils import CONFIG, get_user_libraries, create_default_library
+from .utils import CONFIG
+from .libraries import add_bibcodes
+from .downloads import race_download, get_pdf_store, get_pdf_prefetcher
 
 
 ADS_URL = "ui.adsabs.harvard.edu"
+ARXIV_URL = "arxiv.org"
 
 
 class Article:
-    '''representation of an article, based on an ads.search.Article'''
+    '''representation of an article, based on an ads.search.Article
+
+    Articles can also be made directly from the raw solr documents (dicts)
+    returned by ADS, using `from_doc`, without any `ads` objects in between.
+
+    Only the needed fields are copied out of the entry (which is not kept), and
+    the derived strings (authors, affiliations, etc.) are computed only once.
+    '''
+
+    __slots__ = (
+        'title', '_authors', 'first_author', 'year',
+        'bibcode', '_doi', 'bibstem', 'bibgroup', 'arxiv_id',
+        'abstract', 'read_count', 'date',
+        '_affiliations', 'keywords', '_page', 'detailed',
+        '_id', '_authors_str', '_affiliations_str', '_short_authors'
+    )
+
+    # fields only needed for the detailed view, which may be loaded later
+    _detail_fields = ('aff', 'keyword', 'page')
 
     def __init__(self, entry):
+        self._load(entry._raw)
+
+    @classmethod
+    def from_doc(cls, doc):
+        '''create an article directly from a raw solr document'''
+
+        article = cls.__new__(cls)
+        article._load(doc)
+
+        return article
 
-        self._entry = entry
+    @classmethod
+    def from_docs(cls, docs):
+        '''create a list of articles from a batch of raw solr documents'''
+
+        return [cls.from_doc(doc) for doc in docs]
+
+    def _load(self, doc):
 
         # bibliographic info
-        self.title = entry.title[0]
-        self._authors = entry.author
+        self.title = doc['title'][0]
+        self._authors = tuple(doc['author'])
         self.first_author = self._authors[0]
-        self.year = entry.year
+        self.year = doc['year']
 
         # identifiers
-        self.bibcode = entry.bibcode
-        self._doi = entry.doi if entry.doi is not None else []
-        self.bibstem = entry.bibstem[0]
-        self.bibgroup = entry.bibgroup
-
-        self._identifiers = entry.identifier
+        self.bibcode = doc['bibcode']
+        self._doi = tuple(doc.get('doi') or ())
+        self.bibstem = sys.intern(doc['bibstem'][0])
+        self.bibgroup = doc.get('bibgroup')
 
         try:
-            self.arxiv_id = [id_ for id_ in self._identifiers
+            self.arxiv_id = [id_ for id_ in doc.get('identifier') or []
                              if id_.startswith('arXiv:')][0]
         except IndexError:
             self.arxiv_id = None
 
         # extra frontmatter
-        self.abstract = entry.abstract or "No abstract"
-        self._affiliations = entry.aff
-        self.keywords = entry.keyword
+        self.abstract = doc.get('abstract') or "No abstract"
 
         # analytics
-        self._page = entry.page
-        self.read_count = str(entry.read_count)
-        self.date = entry.pubdate
+        self.read_count = str(doc.get('read_count'))
+        self.date = doc.get('pubdate')
+
+        # memoized derived strings
+        self._id = self._authors_str = self._affiliations_str = None
+        self._short_authors = (None, None)
+
+        # details, only if they were requested (avoids `ads` lazy loading)
+        self._affiliations, self.keywords, self._page = None, None, None
+        self.detailed = False
+
+        if all(field in doc for field in self._detail_fields):
+            self.add_details(doc)
+
+    def add_details(self, doc):
+        '''fill in the detail fields from a document containing them'''
+
+        self._affiliations = doc['aff']
+        self.keywords = doc['keyword']
+        self._page = doc['page']
+
+        self._affiliations_str = None
+
+        self.detailed = True
 
     @property
     def id(self):
-        return f'{self.first_author.split(",")[0]}{self.year}_{self.bibcode}'
+        if self._id is None:
+            first = self.first_author.split(",")[0]
+            self._id = f'{first}{self.year}_{self.bibcode}'
+
+        return self._id
 
     @property
     def authors(self):
-        return '; '.join(self._authors)
+        if self._authors_str is None:
+            self._authors_str = '; '.join(self._authors)
+
+        return self._authors_str
 
     @property
     def affiliations(self):
-        if all([aff == '-' for aff in self._affiliations]):
+
+        if self._affiliations_str is not None:
+            return self._affiliations_str
+
+        if not self._affiliations or all([aff == '-'
+                                          for aff in self._affiliations]):
             out = "No affiliations found"
         else:
             out = '; '.join([f'({i}) {aff}' for i, aff in
                              enumerate(self._affiliations)])
+
+        self._affiliations_str = out
+
         return out
 
     @property
@@ -68,7 +139,7 @@ class Article:
 
     @property
     def page(self):
-        return '; '.join(self._page)
+        return '; '.join(self._page or [])
 
     @property
     def url(self):
@@ -76,9 +147,27 @@ class Article:
 
     @property
     def pdf_url(self):
-        # TODO also optionally support trying "/PUB_PDF" maybe
         return f'https://{ADS_URL}/link_gateway/{self.bibcode}/EPRINT_PDF'
 
+    @property
+    def pdf_urls(self):
+        '''URLs of every source of the PDF, in the order of `pdf_sources`'''
+
+        urls = []
+
+        for source in CONFIG.pdf_sources:
+
+            if source.lower() == 'arxiv':
+                if self.arxiv_id is not None:
+                    id_ = self.arxiv_id.split(':')[-1]
+                    urls.append(f'https://{ARXIV_URL}/pdf/{id_}')
+
+            else:
+                gateway = f'https://{ADS_URL}/link_gateway/{self.bibcode}'
+                urls.append(f'{gateway}/{source}')
+
+        return urls
+
     @property
     def arxiv_url(self):
         if self.arxiv_id is not None:
@@ -94,13 +183,22 @@ class Article:
         if full list fits, use that, otherwise use et al.
         '''
 
+        memo_width, short = self._short_authors
+
+        if memo_width == width:
+            return short
+
         authors = tw.wrap(self.authors, width)
 
         if len(authors) > 1:
-            return self.first_author.split(',')[0] + ' et al.'
+            short = self.first_author.split(',')[0] + ' et al.'
 
         else:
-            return authors[0]
+            short = authors[0]
+
+        self._short_authors = (width, short)
+
+        return short
 
     def short_abstract(self, width, *, Nchars=300, end='...'):
 
@@ -132,13 +230,46 @@ class Article:
 
             return wrap_prop
 
-    def download(self, dest=CONFIG.download_location):
-        import requests
+    def download(self, dest=None, *, progress=None):
+        '''download the PDF of this article into the folder `dest`
+
+        PDFs already in the `PDFStore` (under any bibcode of the same arXiv
+        paper) are linked from there instead, without any download, and PDFs
+        already (speculatively) prefetched are simply moved into place.
+        '''
+
+        if dest is None:
+            dest = CONFIG.download_location
+
+        dest = pathlib.Path(dest, f'{self.id}.pdf')
 
-        pdf_data = requests.get(self.pdf_url)
+        store = get_pdf_store()
 
-        with open(f'{dest}/{self.id}.pdf', 'wb') as dest_file:
-            dest_file.write(pdf_data.content)
+        if store is not None:
+
+            stored = store.lookup(self.bibcode, self.arxiv_id)
+
+            if stored is not None:
+                logging.info(f'linking {self.bibcode} from the PDF store')
+                return store.link(stored, dest)
+
+        # A previous download (e.g. from before the store) is kept
+        if not dest.exists():
+
+            prefetcher = get_pdf_prefetcher()
+
+            if prefetcher and (prefetched := prefetcher.take(self)):
+                logging.info(f'moving prefetched PDF of {self.bibcode}')
+                shutil.move(prefetched, dest)
+
+            else:
+                race_download(self.pdf_urls, dest, progress=progress,
+                              hedge_delay=CONFIG.pdf_hedge_delay)
+
+        if store is not None:
+            store.add(dest, self.bibcode, self.arxiv_id)
+
+        return dest
 
     def open_online(self, *, source='ADS'):
         import webbrowser as wb
@@ -154,16 +285,7 @@ class Article:
 
     def add_to_library(self, *, name='papermate'):
 
-        library_map = get_user_libraries()
-
-        if name not in library_map:
-            library_map |= create_default_library()
-
-        id_ = library_map[name]
-
-        lib = ads.libraries.Library(id_)
-
-        resp = lib.add_documents(self.bibcode)
+        resp = add_bibcodes([self.bibcode], name=name)
 
         if resp == 0:
             mssg = "Could not add this article to library. May already exist."
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import threading
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from .utils import CONFIG
+
+
+__all__ = ['get_session', 'share_with_ads', 'connection_stats']
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+class _ADSTokenAuth(requests.auth.AuthBase):
+    '''add the ADS API token (and headers) only to requests made to ADS
+
+    As the same session is also used for downloading from other hosts (e.g.
+    arXiv), the token should never be sent along with every request.
+    '''
+
+    def __init__(self):
+        import ads.config
+
+        self.host = urllib.parse.urlsplit(ads.config.ADSWS_API_URL).hostname
+
+        self._token = None
+
+    @property
+    def token(self):
+        import ads.base
+
+        if self._token is None:
+            self._token = ads.base.BaseQuery().token
+
+        return self._token
+
+    def __call__(self, request):
+
+        if urllib.parse.urlsplit(request.url).hostname == self.host:
+            request.headers['Authorization'] = f'Bearer {self.token}'
+            request.headers.setdefault('Content-Type', 'application/json')
+
+        return request
+
+
+class _PoolAdapter(requests.adapters.HTTPAdapter):
+    '''HTTP adapter which applies a default timeout to all requests'''
+
+    def __init__(self, *, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+
+        if timeout is None:
+            timeout = self.timeout
+
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def get_session():
+    '''return the single process-wide HTTP session
+
+    The session keeps a pool of (keep-alive) connections to each host, of at
+    most `http_pool_size` connections per host, shared by all threads.
+    '''
+    global _SESSION
+
+    with _SESSION_LOCK:
+
+        if _SESSION is None:
+
+            session = requests.Session()
+            session.auth = _ADSTokenAuth()
+
+            adapter = _PoolAdapter(timeout=CONFIG.http_timeout,
+                                   pool_maxsize=CONFIG.http_pool_size,
+                                   pool_block=True)
+
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            _SESSION = session
+
+    return _SESSION
+
+
+def share_with_ads():
+    '''make every query made through the `ads` package use the shared session
+
+    `ads` otherwise creates a new session (and connections) for every query.
+    The session itself is only created once the first query is made.
+    '''
+    import ads.base
+
+    ads.base.BaseQuery.session = property(lambda self: get_session())
+
+
+def connection_stats():
+    '''count the connections opened, and reused, by the shared session'''
+
+    stats = {'opened': 0, 'reused': 0}
+
+    if _SESSION is None:
+        return stats
+
+    for adapter in set(_SESSION.adapters.values()):
+
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+
+            pool = pools[key]
+
+            stats['opened'] += pool.num_connections
+            stats['reused'] += pool.num_requests - pool.num_connections
+
+    return stats
+
+
+@atexit.register
+def _log_connection_stats():
+    if _SESSION is not None:
+        logging.info(f'HTTP connections: {connection_stats()}')
@@ -0,0 +1,622 @@
+import os
+import re
+import json
+import atexit
+import shutil
+import hashlib
+import logging
+import pathlib
+import tempfile
+import threading
+import concurrent.futures
+
+from .utils import CONFIG, DaemonExecutor
+
+
+__all__ = ['download_file', 'race_download',
+           'DownloadManager', 'get_download_manager',
+           'PDFStore', 'get_pdf_store', 'PDFPrefetcher', 'get_pdf_prefetcher']
+
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+_PREFETCHER = None
+_PREFETCHER_LOCK = threading.Lock()
+
+
+def download_file(url, dest, *, chunk_size=64 * 1024, progress=None,
+                  cancel=None, magic=None):
+    '''stream the file at `url` to `dest`, resuming any partial download
+
+    The file is written in chunks to a partial (`.part`) file next to `dest`,
+    which is only moved to `dest` once complete. If a partial file already
+    exists, only the remaining bytes are requested (through a Range header).
+
+    `progress`, if given, is called with the bytes written and the total size
+    (or None, if unknown) after every chunk. If the `cancel` event is set, the
+    download is stopped, its partial file removed, and `CancelledError` raised.
+
+    If the file does not begin with the bytes `magic` (e.g. an HTML page
+    instead of a PDF), the download is stopped and a `ValueError` raised.
+    '''
+
+    from .connections import get_session
+
+    dest = pathlib.Path(dest)
+    part = dest.with_name(f'{dest.name}.part')
+
+    offset = part.stat().st_size if part.exists() else 0
+
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with get_session().get(url, headers=headers, stream=True) as resp:
+
+        # Partial file is already complete
+        if resp.status_code == 416:
+            os.replace(part, dest)
+            return dest
+
+        resp.raise_for_status()
+
+        # Server doesn't support ranges, and is sending the whole file again
+        if offset and resp.status_code != 206:
+            logging.info(f'{url} does not support resuming, restarting')
+            offset = 0
+
+        total = resp.headers.get('Content-Length')
+        total = int(total) + offset if total is not None else None
+
+        written = offset
+
+        with open(part, 'ab' if offset else 'wb') as file:
+
+            for chunk in resp.iter_content(chunk_size):
+
+                if cancel is not None and cancel.is_set():
+                    break
+
+                if magic and written == 0 and not chunk.startswith(magic):
+                    mssg = f'{url} did not return a valid file'
+                    raise ValueError(mssg)
+
+                file.write(chunk)
+                written += len(chunk)
+
+                if progress is not None:
+                    progress(written, total)
+
+    if cancel is not None and cancel.is_set():
+        part.unlink(missing_ok=True)
+        raise concurrent.futures.CancelledError(f'{url} download cancelled')
+
+    os.replace(part, dest)
+
+    return dest
+
+
+class _EitherEvent:
+    '''set if any of a number of events (or None) are set'''
+
+    def __init__(self, *events):
+        self.events = [ev for ev in events if ev is not None]
+
+    def is_set(self):
+        return any(ev.is_set() for ev in self.events)
+
+
+def race_download(urls, dest, *, hedge_delay=1., cancel=None, **kwargs):
+    '''download the same PDF from a number of sources, keeping the fastest
+
+    Sources are started in order, with each next source started only once no
+    started source has given a valid PDF within `hedge_delay` seconds, or once
+    one of them has failed. The first valid PDF is kept, and the downloads
+    from all other sources cancelled.
+
+    Any other arguments are passed to `download_file`.
+    '''
+
+    dest = pathlib.Path(dest)
+
+    if not (urls := list(urls)):
+        raise ValueError('No sources to download from')
+
+    won = threading.Event()
+    either = _EitherEvent(won, cancel)
+
+    # Daemon workers, so that exiting never waits on any source
+    pool = DaemonExecutor(len(urls))
+
+    # future -> url of every source started
+    sources, pending, error = {}, set(), None
+
+    def discard(fut):
+        '''remove the file of a losing source, if it finished anyway'''
+        if not fut.cancelled() and fut.exception() is None:
+            fut.result().unlink(missing_ok=True)
+
+    try:
+
+        for ind, url in enumerate(urls):
+
+            if cancel is not None and cancel.is_set():
+                raise concurrent.futures.CancelledError(f'{dest} cancelled')
+
+            # Each source is downloaded to its own file, moved once it has won
+            src_dest = dest.with_name(f'{dest.name}.src{ind}')
+
+            fut = pool.submit(download_file, url, src_dest, cancel=either,
+                              magic=b'%PDF', **kwargs)
+
+            sources[fut] = url
+            pending.add(fut)
+
+            is_last = ind == len(urls) - 1
+
+            # Wait on the last source, otherwise only until time to hedge
+            while pending:
+
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=None if is_last else hedge_delay,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for fut in done:
+
+                    if (error := fut.exception()) is not None:
+                        logging.info(f'PDF source failed: {error}')
+                        continue
+
+                    won.set()
+
+                    logging.info(f'downloaded {dest.name} from {sources[fut]}')
+
+                    os.replace(fut.result(), dest)
+
+                    for loser in sources.keys() - {fut}:
+                        loser.add_done_callback(discard)
+
+                    return dest
+
+                if not is_last:
+                    break
+
+        raise error
+
+    finally:
+        won.set()
+        pool.shutdown(wait=False)
+
+
+class PDFStore:
+    '''content-addressed store of every PDF downloaded
+
+    Each PDF is kept once, named by the sha256 hash of its contents, and an
+    index file maps the arXiv ID and bibcode of each article to its PDF. The
+    same paper, under a different bibcode (e.g. the arXiv and journal versions)
+    or downloaded again on a later day, is hard-linked into place from the
+    store rather than downloaded again.
+    '''
+
+    def __init__(self, root):
+
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.index_file = self.root / 'index.json'
+
+        self._lock = threading.Lock()
+
+        try:
+            with open(self.index_file) as file:
+                self._index = json.load(file)
+
+        except FileNotFoundError:
+            self._index = {}
+
+        except ValueError as err:
+            logging.warning(f'Could not read PDF store index: {err}')
+            self._index = {}
+
+    @staticmethod
+    def _keys(bibcode, arxiv_id=None):
+        '''the index keys of an article, by unversioned arXiv ID and bibcode'''
+
+        keys = [f'bibcode:{bibcode}']
+
+        if arxiv_id is not None:
+            id_ = re.sub(r'v\d+$', '', arxiv_id.split(':')[-1])
+            keys.insert(0, f'arxiv:{id_}')
+
+        return keys
+
+    def _write_index(self):
+
+        tmp = self.index_file.with_suffix('.tmp')
+
+        with open(tmp, 'w') as file:
+            json.dump(self._index, file)
+
+        os.replace(tmp, self.index_file)
+
+    def lookup(self, bibcode, arxiv_id=None):
+        '''return the stored PDF of this article, or None if not stored'''
+
+        with self._lock:
+
+            for key in self._keys(bibcode, arxiv_id):
+
+                if (digest := self._index.get(key)) is None:
+                    continue
+
+                if (path := self.root / f'{digest}.pdf').exists():
+                    return path
+
+        return None
+
+    def add(self, path, bibcode, arxiv_id=None):
+        '''add this (downloaded) PDF of an article to the store
+
+        If the same contents are already stored, `path` is replaced by a link
+        to those, so that every copy shares the same file on disk.
+        '''
+
+        sha = hashlib.sha256()
+
+        with open(path, 'rb') as file:
+            while chunk := file.read(1024 * 1024):
+                sha.update(chunk)
+
+        digest = sha.hexdigest()
+
+        stored = self.root / f'{digest}.pdf'
+
+        with self._lock:
+
+            if stored.exists():
+                self.link(stored, path, replace=True)
+
+            else:
+                _link_or_copy(path, stored)
+
+            for key in self._keys(bibcode, arxiv_id):
+                self._index[key] = digest
+
+            self._write_index()
+
+        return stored
+
+    def link(self, stored, dest, *, replace=False):
+        '''place the stored PDF at `dest`, hard-linked where possible'''
+
+        dest = pathlib.Path(dest)
+
+        if dest.exists():
+
+            if not replace or dest.samefile(stored):
+                return dest
+
+            dest.unlink()
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+        _link_or_copy(stored, dest)
+
+        return dest
+
+
+def _link_or_copy(src, dest):
+    '''hard-link `src` to `dest`, or copy it across different filesystems'''
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def get_pdf_store():
+    '''return the single process-wide PDF store, or None if disabled'''
+    global _STORE
+
+    with _STORE_LOCK:
+
+        if _STORE is None and CONFIG.pdf_store:
+            _STORE = PDFStore(pathlib.Path(CONFIG.pdf_store).expanduser())
+
+    return _STORE
+
+
+class PDFPrefetcher:
+    '''speculatively download PDFs, before they are asked for
+
+    PDFs are downloaded in the background into a temporary folder, holding at
+    most `max_size` bytes of PDFs (the oldest are removed first), from which
+    they can be taken once actually wanted, or else cancelled. Exiting never
+    waits on any PDFs still being prefetched.
+    '''
+
+    def __init__(self, root, *, max_size=200e6, max_workers=2):
+
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.max_size = max_size
+
+        self._pool = DaemonExecutor(max_workers)
+
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+        # bibcode -> (future, cancel event)
+        self._fetches = {}
+
+    def start(self, article):
+        '''start prefetching the PDF of this article, unless already kept'''
+
+        if self._available(article):
+            return
+
+        with self._lock:
+
+            if article.bibcode in self._fetches:
+                return
+
+            cancel = threading.Event()
+
+            fut = self._pool.submit(self._fetch, article, cancel)
+
+            self._fetches[article.bibcode] = (fut, cancel)
+
+    @staticmethod
+    def _available(article):
+        '''whether the PDF of this article is already stored or downloaded'''
+
+        store = get_pdf_store()
+
+        if store is not None:
+            if store.lookup(article.bibcode, article.arxiv_id) is not None:
+                return True
+
+        dest = pathlib.Path(CONFIG.download_location, f'{article.id}.pdf')
+
+        return dest.exists()
+
+    def _fetch(self, article, cancel):
+
+        dest = self.root / f'{article.bibcode}.pdf'
+
+        race_download(article.pdf_urls, dest, cancel=cancel,
+                      hedge_delay=CONFIG.pdf_hedge_delay)
+
+        self._evict(keep=dest)
+
+        return dest
+
+    def _evict(self, keep):
+        '''remove the oldest prefetched PDFs, until within `max_size`'''
+
+        with self._evict_lock:
+
+            files = []
+
+            for file in self.root.glob('*.pdf'):
+                try:
+                    files.append((file, file.stat()))
+                except FileNotFoundError:
+                    continue  # taken in the meantime
+
+            files.sort(key=lambda item: item[1].st_mtime)
+
+            size = sum(stat.st_size for _, stat in files)
+
+            for file, stat in files:
+
+                if size <= self.max_size:
+                    break
+
+                if file == keep:
+                    continue
+
+                size -= stat.st_size
+                file.unlink(missing_ok=True)
+
+    def cancel(self, article):
+        '''stop prefetching the PDF of this article'''
+
+        with self._lock:
+
+            if (fetch := self._fetches.pop(article.bibcode, None)) is None:
+                return
+
+        fut, cancel = fetch
+
+        if not fut.cancel():
+            cancel.set()
+
+        # Already finished, so just free up the space
+        if fut.done() and not fut.cancelled() and fut.exception() is None:
+            fut.result().unlink(missing_ok=True)
+
+        logging.info(f'cancelled prefetching the PDF of {article.bibcode}')
+
+    def take(self, article):
+        '''return the prefetched PDF of this article, waiting if in progress
+
+        returns None if this article was not (successfully) prefetched
+        '''
+
+        with self._lock:
+
+            if (fetch := self._fetches.pop(article.bibcode, None)) is None:
+                return None
+
+        try:
+            path = fetch[0].result()
+
+        except Exception as err:
+            logging.info(f'prefetching {article.bibcode} failed: {err}')
+            return None
+
+        # May have since been evicted
+        return path if path.exists() else None
+
+    def close(self):
+        '''stop all prefetching'''
+
+        with self._lock:
+            fetches, self._fetches = self._fetches, {}
+
+        for _, cancel in fetches.values():
+            cancel.set()
+
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_pdf_prefetcher():
+    '''return the single process-wide PDF prefetcher, or None if disabled'''
+    global _PREFETCHER
+
+    with _PREFETCHER_LOCK:
+
+        if _PREFETCHER is None and CONFIG.prefetch_pdfs:
+
+            # Private to this user and session (created with mode 0700)
+            root = tempfile.mkdtemp(prefix='pmate_prefetch_')
+
+            max_size = CONFIG.prefetch_pdf_size * 1e6
+
+            _PREFETCHER = PDFPrefetcher(root, max_size=max_size)
+
+            # Closed on quitting, leaving only the folder to be removed
+            atexit.register(shutil.rmtree, root, ignore_errors=True)
+
+    return _PREFETCHER
+
+
+class DownloadManager:
+    '''download the PDFs of articles concurrently, in the background
+
+    At most `max_workers` articles are downloaded at once. The progress of all
+    downloads submitted since the manager was last idle is given by `status`.
+    Exiting never waits on any downloads still running, or queued.
+    '''
+
+    def __init__(self, dest, *, max_workers=4):
+
+        self.dest = pathlib.Path(dest)
+
+        self._pool = DaemonExecutor(max_workers)
+
+        self._lock = threading.Lock()
+
+        # bibcode -> future, and bibcode -> (bytes written, total bytes)
+        self._futures, self._progress = {}, {}
+
+        self._reported = True
+
+    def submit(self, article):
+        '''start downloading this article, returning its future'''
+
+        with self._lock:
+
+            # Reuse any download of this article already in progress
+            if (fut := self._futures.get(article.bibcode)) is not None:
+                if not fut.done():
+                    return fut
+
+            self.dest.mkdir(parents=True, exist_ok=True)
+
+            self._progress[article.bibcode] = (0, None)
+            self._reported = False
+
+            fut = self._pool.submit(self._download, article)
+
+            self._futures[article.bibcode] = fut
+
+        return fut
+
+    @property
+    def idle(self):
+        '''whether all downloads have finished, and that has been reported'''
+        return self._reported
+
+    def submit_all(self, articles):
+        '''start downloading all of these articles'''
+        return [self.submit(article) for article in articles]
+
+    def _download(self, article):
+
+        def progress(written, total):
+            self._progress[article.bibcode] = (written, total)
+
+        try:
+            return article.download(self.dest, progress=progress)
+
+        except Exception as err:
+            logging.warning(f'Could not download {article.bibcode}: {err}')
+            raise
+
+    def status(self):
+        '''a status message of the progress of all downloads
+
+        returns None if there is nothing new to report
+        '''
+
+        with self._lock:
+
+            if self._reported:
+                return None
+
+            futures = list(self._futures.values())
+
+            Ndone = sum(fut.done() for fut in futures)
+            Nfailed = sum(fut.done() and fut.exception() is not None
+                          for fut in futures)
+
+            if Ndone == len(futures):
+
+                # Report the finished batch once, and start a new one
+                self._reported = True
+                self._futures, self._progress = {}, {}
+
+                mssg = f'Downloaded {Ndone - Nfailed} articles'
+
+                if Nfailed:
+                    mssg += f' ({Nfailed} failed, see log)'
+
+                return mssg
+
+            written = sum(w for w, _ in self._progress.values())
+
+            mssg = f'Downloading ({Ndone}/{len(futures)}) '
+
+            totals = [t for _, t in self._progress.values()]
+
+            if None not in totals:
+                mssg += f'{100 * written / max(sum(totals), 1):.0f}%'
+            else:
+                mssg += f'{written / 1e6:.1f} MB'
+
+            return mssg
+
+    def close(self):
+        '''stop any downloads which have not started yet'''
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_download_manager():
+    '''return the single process-wide download manager'''
+    global _MANAGER
+
+    with _MANAGER_LOCK:
+
+        if _MANAGER is None:
+
+            _MANAGER = DownloadManager(CONFIG.download_location,
+                                       max_workers=CONFIG.download_workers)
+
+            atexit.register(_MANAGER.close)
+
+    return _MANAGER
@@ -1,16 +1,19 @@
+import time
 import logging
 import datetime
 import threading
 import curses as cs
+import concurrent.futures
 
 from .interface import TitleBar, CommandBar
 from .interface import ListView, LibraryView, DetailedView
 from .interface import IntroView, NoConfigView, BaseView, ResponseErrorView
-from ..queries import QuerySet, Library
+from ..libraries import get_library_queue, in_library
+from ..downloads import get_download_manager, get_pdf_prefetcher
+from ..seen import get_seen_index
 from ..utils import CONFIG, get_user_libraries, create_default_library
-from ..utils import prev, BidirectionalCycler, Cache, DateCache
-
-from ads.exceptions import APIResponseError
+from ..utils import prev, step_date, BidirectionalCycler
+from ..utils import Cache, DateCache, Prefetcher, ResultStore
 
 
 __all__ = ["controller"]
@@ -27,22 +30,28 @@ SELECT = (ord('\n'), ord('\r'), cs.KEY_ENTER)
 
 BACK = (ord('b'), cs.KEY_BACKSPACE)
 COPY, DOWNLOAD, ONLINE, ADD_LIBRARY = ord('c'), ord('d'), ord('o'), ord('l')
+DOWNLOAD_ALL, HIDE_SEEN = ord('D'), ord('h')
 
 # Feel like these should be stored in the views themselves, and a mapping
 # function given in the views
 
 COMMANDS = {
     'list': {
-        DATE_UP, DATE_DOWN, CURS_UP, CURS_DOWN, CURS_SUP, CURS_SDOWN, *SELECT
+        DATE_UP, DATE_DOWN, CURS_UP, CURS_DOWN, CURS_SUP, CURS_SDOWN,
+        DOWNLOAD_ALL, HIDE_SEEN, *SELECT
     },
     'detailed': {
         COPY, DOWNLOAD, ONLINE, ADD_LIBRARY, *BACK
     },
     'library': {
-        LIB_UP, LIB_DOWN, CURS_UP, CURS_DOWN, CURS_SUP, CURS_SDOWN, *SELECT
+        LIB_UP, LIB_DOWN, CURS_UP, CURS_DOWN, CURS_SUP, CURS_SDOWN,
+        DOWNLOAD_ALL, HIDE_SEEN, *SELECT
     }
 }
 
+# Milliseconds between polls for background progress, while there is any
+POLL_INTERVAL = 250
+
 EXIT_CMDS = {
     ord('q'), 'ctrl-c', 27  # Escape key = 27, but there is a huge delay
 }
@@ -95,6 +104,65 @@ def flash_error(screen, view, *args, titlebar=None, cmdbar=None, **kwargs):
         raise SystemExit
 
 
+def previous_days(date, N):
+    '''list the `N` days (skipping weekends if required) before date'''
+
+    days = []
+
+    for _ in range(N):
+        date = step_date(date, -1)
+        days.append(date)
+
+    return days
+
+
+def wait_thread(future):
+    '''start a thread which simply waits on a future, for loading dialogs'''
+
+    th = threading.Thread(target=concurrent.futures.wait, args=[[future]],
+                          daemon=True)
+    th.start()
+
+    return th
+
+
+def fill_details(article, cmdbar):
+    '''load the details of an article (if lightly loaded) before viewing it'''
+    from ..queries import load_details
+    from ads.exceptions import APIResponseError
+    from requests import RequestException
+
+    # Opened without its details if these can't be loaded (e.g. offline)
+    try:
+        load_details([article])
+
+    except (APIResponseError, RequestException) as err:
+        logging.warning(f'Could not load details of {article.bibcode}: {err}')
+        cmdbar.status = 'Could not load article details'
+
+
+def prefetch_status(futures):
+    '''a status message of the progress of some prefetching futures'''
+
+    Ndone = sum(fut.done() for fut in futures)
+
+    if Ndone == len(futures):
+        return None
+
+    return f'Prefetching ({Ndone}/{len(futures)})...'
+
+
+def open_article(view):
+    '''the article selected in a list view, marked as read, if any'''
+
+    if (article := view.selection) is not None:
+
+        if (seen := get_seen_index()) is not None:
+            seen.mark_read(article.bibcode)
+
+    return article
+
+
 def controller(screen, mode=None):
     '''designed to be used by a curses wrapper `curses.wrapper(controller)`'''
 
@@ -200,6 +268,10 @@ def daily_controller(screen):
 
     view = IntroView(content_window)
 
+    # Only imported once the screen is drawn, as `ads` is slow to import
+    from ..queries import QuerySet
+    from ads.exceptions import APIResponseError
+
     # ----------------------------------------------------------------------
     # Gather initial article list, draw initial list view
     # ----------------------------------------------------------------------
@@ -222,6 +294,8 @@ def daily_controller(screen):
 
     cache = DateCache({date: search_results})
 
+    prefetcher = Prefetcher(queries.execute, cache)
+
     logging.info('Articles loaded')
 
     current_article = None
@@ -230,14 +304,18 @@ def daily_controller(screen):
 
     titlebar.title = f'Daily arXiv feed'
 
-    cmdbar.commands = {'z/x': 'Prev/Next Day', '\u21B3': 'Select Article'}
+    cmdbar.commands = {'z/x': 'Prev/Next Day', '\u21B3': 'Select Article',
+                       'D': 'Download all', 'h': 'Hide seen'}
     cmdbar.status = 'Select an article for more details'
 
     # draw_listview(content_window, search_results, 0)
 
     logging.info('Initial view drawn')
 
-    view = ListView(content_window, date, search_results)
+    # Whether to hide articles already seen, toggled with `h`
+    hide_seen = CONFIG.hide_seen
+
+    view = ListView(content_window, date, search_results, hide_seen=hide_seen)
 
     logging.info(f'Heres the class:  {view}')
     logging.info(f'  {view.max_height=}, {view.max_width=}')
@@ -248,14 +326,59 @@ def daily_controller(screen):
 
     # lw.draw()
 
+    prefetcher.prefetch(previous_days(date, CONFIG.prefetch_days))
+
+    # Library adds are queued and sent in the background, polling for results
+    library_queue = get_library_queue() if CONFIG.batch_library_adds else None
+
+    downloads = get_download_manager()
+
+    # PDFs of opened articles may be downloaded speculatively, if enabled
+    pdf_prefetcher, opened = get_pdf_prefetcher(), 0.
+
+    # The results, and number of their streams, whose failure was reported
+    reported_errors = None
+
     # ----------------------------------------------------------------------
     # Mainloop
     # ----------------------------------------------------------------------
 
     while True:
 
+        # Note any streamed results which stopped early, as pages failed
+        errors = (search_results, len(search_results.errors))
+
+        if errors[1] and errors != reported_errors:
+
+            reported_errors = errors
+
+            cmdbar.status = (f'Could not load all results of {errors[1]} '
+                             f'of the queries, see log')
+
+        # Only poll while there is any background progress left to report
+        polling = (not downloads.idle
+                   or library_queue is not None and not library_queue.idle)
+
+        screen.timeout(POLL_INTERVAL if polling else -1)
+
         cmd = screen.getch()
 
+        # ------------------------------------------------------------------
+        # No command given before timeout, report any background progress
+        # ------------------------------------------------------------------
+
+        if cmd == cs.ERR:
+
+            if library_queue is not None:
+
+                if (mssg := library_queue.pop_message()) is not None:
+                    cmdbar.status = mssg
+
+            if (status := downloads.status()) is not None:
+                cmdbar.status = status
+
+            continue
+
         logging.info(f'received command : {cmd} ({chr(cmd)})')
 
         # check that cmd is right for this view
@@ -273,7 +396,11 @@ def daily_controller(screen):
 
                 logging.info('Selecting article')
 
-                current_article = search_results.articles[view.selection_ind]
+                if (current_article := open_article(view)) is None:
+                    continue
+
+                # Keep showing the same articles, once back from this one
+                shown = view.shown
 
                 titlebar.title = f'Article Details'
 
@@ -281,6 +408,12 @@ def daily_controller(screen):
                                    'l': 'Add to library', 'b': 'return'}
                 cmdbar.status = ''
 
+                if pdf_prefetcher is not None:
+                    pdf_prefetcher.start(current_article)
+                    opened = time.monotonic()
+
+                fill_details(current_article, cmdbar)
+
                 view = DetailedView(content_window, current_article,
                                     curs_ind=view.curs_ind, page=view.page)
 
@@ -292,17 +425,24 @@ def daily_controller(screen):
 
                 logging.info('Going back')
 
+                # Going straight back, the PDF is probably not wanted after all
+                if pdf_prefetcher is not None:
+                    if time.monotonic() - opened < CONFIG.prefetch_pdf_cancel:
+                        pdf_prefetcher.cancel(current_article)
+
                 current_article = None
 
                 titlebar.title = f'Daily arXiv feed'
 
                 cmdbar.commands = {'z/x': 'Prev/Next Day',
-                                   '\u21B3': 'Select Article'}
+                                   '\u21B3': 'Select Article',
+                                   'D': 'Download all', 'h': 'Hide seen'}
 
                 cmdbar.status = 'Select an article for more details'
 
                 view = ListView(content_window, date, search_results,
-                                curs_ind=view.curs_ind, page=view.page)
+                                curs_ind=view.curs_ind, page=view.page,
+                                hide_seen=hide_seen, keep=shown)
 
             # --------------------------------------------------------------
             # Change dates
@@ -313,18 +453,14 @@ def daily_controller(screen):
                 logging.info('Moving date')
 
                 td = 1 if cmd == DATE_UP else -1
-                date += datetime.timedelta(days=td)
+                new_date = step_date(date, td)
 
                 # Check that this date isn't in the future
-                if date.date() > datetime.datetime.today().date():
+                if new_date.date() > datetime.datetime.today().date():
                     logging.info("Can't move into the future, revert to today")
-                    date -= datetime.timedelta(days=td)
                     continue
 
-                # Check that this isn't a weekend we want to skip
-                if CONFIG.skip_weekends and date.weekday() >= 5:
-                    logging.info('Skipping over the weekend')
-                    date += datetime.timedelta(days=2 * td)
+                date = new_date
 
                 cmdbar.status = 'Loading articles...'
 
@@ -336,36 +472,51 @@ def daily_controller(screen):
 
                     logging.info('executing this query')
 
-                    try:
+                    # Reuses any prefetch of this date already in progress
+                    future = prefetcher.fetch(date)
 
-                        if CONFIG.show_loading:
-                            logging.info('starting the thread')
+                    if CONFIG.show_loading:
+                        logging.info('starting the thread')
 
-                            th = threading.Thread(target=queries.execute,
-                                                  args=[date], daemon=True)
+                        th = wait_thread(future)
 
-                            th.start()
-                            logging.info('thread is running')
+                        logging.info('thread is running')
 
-                            view.loading_dialog(th)
+                        view.loading_dialog(th)
 
-                            logging.info('thread is dead')
+                        logging.info('thread is dead')
 
-                        else:
-                            queries.execute(date)
+                    try:
+                        search_results = future.result()
 
                     except APIResponseError as err:
                         return flash_error(screen, ResponseErrorView,
                                            content_window, err.response,
                                            titlebar=titlebar, cmdbar=cmdbar)
 
-                    search_results = queries.results
-                    cache.cache_results(date, search_results)
-
                 titlebar.title = f'Daily arXiv feed'
                 cmdbar.status = 'Select an article for more details'
 
-                view = ListView(content_window, date, search_results)
+                view = ListView(content_window, date, search_results,
+                                hide_seen=hide_seen)
+
+                prefetcher.prefetch(previous_days(date, CONFIG.prefetch_days))
+
+            # --------------------------------------------------------------
+            # Show or hide articles already seen
+            # --------------------------------------------------------------
+
+            elif cmd == HIDE_SEEN:
+
+                logging.info('Toggling seen articles')
+
+                hide_seen = not hide_seen
+
+                cmdbar.status = ('Hiding seen articles' if hide_seen
+                                 else 'Showing all articles')
+
+                view = ListView(content_window, date, search_results,
+                                hide_seen=hide_seen)
 
             # --------------------------------------------------------------
             # Scroll through articles
@@ -403,25 +554,18 @@ def daily_controller(screen):
 
                 logging.info('Downloading file')
 
-                cmdbar.status = 'Downloading file...'
-
-                if CONFIG.show_loading:
-                    logging.info('starting the thread')
-
-                    th = threading.Thread(target=current_article.download,
-                                          daemon=True)
+                # Downloaded in the background, polling for progress
+                downloads.submit(current_article)
 
-                    th.start()
-                    logging.info('thread is running')
+                cmdbar.status = 'Downloading file...'
 
-                    view.loading_dialog(th, message='Downloading file')
+            elif cmd == DOWNLOAD_ALL:
 
-                    logging.info('thread is dead')
+                logging.info('Downloading all files')
 
-                else:
-                    current_article.download()
+                downloads.submit_all(search_results.articles)
 
-                cmdbar.status = ''
+                cmdbar.status = 'Downloading all files...'
 
             elif cmd == COPY:
 
@@ -446,6 +590,20 @@ def daily_controller(screen):
 
                 logging.info('Adding to default library')
 
+                if in_library(current_article.bibcode, name=DEFAULT_LIBRARY):
+                    cmdbar.status = 'Article is already in library'
+                    continue
+
+                if library_queue is not None:
+
+                    library_queue.add(current_article.bibcode,
+                                      name=DEFAULT_LIBRARY)
+
+                    Nqueued = len(library_queue)
+                    cmdbar.status = f'Queued for library ({Nqueued} waiting)'
+
+                    continue
+
                 cmdbar.status = 'Adding to library...'
 
                 try:
@@ -486,7 +644,8 @@ def daily_controller(screen):
             # have to recreate view due to fixed content sizes at inits
             if view.type == 'list':
                 view = ListView(content_window, date, search_results,
-                                curs_ind=view.curs_ind, page=view.page)
+                                curs_ind=view.curs_ind, page=view.page,
+                                hide_seen=hide_seen, keep=view.shown)
 
             elif view.type == 'detailed':
                 view = DetailedView(content_window, current_article)
@@ -496,7 +655,13 @@ def daily_controller(screen):
         # ------------------------------------------------------------------
 
         elif cmd in EXIT_CMDS:
-            # do quitty stuff
+            # do quitty stuff, without waiting on any days still prefetching
+            prefetcher.close()
+            downloads.close()
+
+            if pdf_prefetcher is not None:
+                pdf_prefetcher.close()
+
             raise SystemExit
 
         # some other inconsequential cmd
@@ -509,8 +674,6 @@ def library_controller(screen):
 
     logging.info('starting log - library controller')
 
-    date = datetime.datetime.today()
-
     # ----------------------------------------------------------------------
     # Screen initialization
     # ----------------------------------------------------------------------
@@ -521,6 +684,10 @@ def library_controller(screen):
 
     logging.info('Screen initialized')
 
+    # Only imported once the screen is drawn, as `ads` is slow to import
+    from ..queries import Library
+    from ads.exceptions import APIResponseError
+
     # ----------------------------------------------------------------------
     # Gather initial article list, draw initial list view
     # ----------------------------------------------------------------------
@@ -538,12 +705,23 @@ def library_controller(screen):
 
     library_cycle = BidirectionalCycler(library_map)
 
+    store = None
+    if CONFIG.cache_results:
+        store = ResultStore(CONFIG.cache_file, ttl=CONFIG.cache_ttl)
+
     id_ = library_map[DEFAULT_LIBRARY]
 
-    library = Library(id_)
+    def load_library(id_):
+        return Library(id_, light=CONFIG.light_fields, store=store,
+                       max_workers=CONFIG.query_workers)
+
+    library = load_library(id_)
 
     cache = Cache({id_: library})
 
+    prefetcher = Prefetcher(load_library, cache,
+                            max_workers=CONFIG.query_workers)
+
     logging.info('Library loaded')
 
     current_article = None
@@ -552,13 +730,17 @@ def library_controller(screen):
 
     titlebar.title = f'NASA ADS Library'
 
-    cmdbar.commands = {'z/x': 'Prev/Next Library', '\u21B3': 'Select Article'}
+    cmdbar.commands = {'z/x': 'Prev/Next Library', '\u21B3': 'Select Article',
+                       'D': 'Download all', 'h': 'Hide seen'}
 
     cmdbar.status = 'Select an article for more details'
 
     logging.info('Initial view drawn')
 
-    view = LibraryView(content_window, library)
+    # Whether to hide articles already seen, toggled with `h`
+    hide_seen = CONFIG.hide_seen
+
+    view = LibraryView(content_window, library, hide_seen=hide_seen)
 
     logging.info(f'Heres the class:  {view}')
     logging.info(f'  {view.max_height=}, {view.max_width=}')
@@ -567,14 +749,84 @@ def library_controller(screen):
 
     logging.info('trying to draw it')
 
+    # Load all other libraries in the background, polling for their progress
+    prefetching = prefetcher.prefetch(library_map.values())
+
+    downloads = get_download_manager()
+
+    # PDFs of opened articles may be downloaded speculatively, if enabled
+    pdf_prefetcher, opened = get_pdf_prefetcher(), 0.
+
+    # The library, and number of its pages, whose failure was last reported
+    reported_failures = None
+
     # ----------------------------------------------------------------------
     # Mainloop
     # ----------------------------------------------------------------------
 
     while True:
 
+        # Only poll while anything is still loading, or left to report. The
+        # library is checked first, as its last pages are appended (or marked
+        # failed) before it stops loading
+        loading = library.loading
+
+        failures = (library, len(library.failed_pages))
+
+        polling = (loading
+                   or (view.type == 'library'
+                       and view.Nloaded != len(library.articles))
+                   or (failures[1] and failures != reported_failures)
+                   or prefetching or not downloads.idle)
+
+        screen.timeout(POLL_INTERVAL if polling else -1)
+
         cmd = screen.getch()
 
+        # ------------------------------------------------------------------
+        # No command given before timeout, update prefetching progress
+        # ------------------------------------------------------------------
+
+        if cmd == cs.ERR:
+
+            # Add any newly loaded pages of a large library to the view
+            Nloaded = len(library.articles)
+
+            if view.type == 'library' and view.Nloaded != Nloaded:
+
+                logging.info('Adding newly loaded articles to library view')
+
+                view = LibraryView(content_window, library,
+                                   curs_ind=view.curs_ind, page=view.page,
+                                   hide_seen=hide_seen, keep=view.shown)
+
+            if prefetching:
+
+                if (status := prefetch_status(prefetching)) is None:
+                    logging.info('All libraries prefetched')
+
+                    prefetching = []
+
+                    status = ('Select an article for more details'
+                              if view.type == 'library' else '')
+
+                cmdbar.status = status
+
+            # Note any pages of this library which could not be loaded
+            failures = (library, len(library.failed_pages))
+
+            if failures[1] and failures != reported_failures:
+
+                reported_failures = failures
+
+                cmdbar.status = (f'Could not load {failures[1]} pages of '
+                                 f'library, reopen it to retry')
+
+            if (status := downloads.status()) is not None:
+                cmdbar.status = status
+
+            continue
+
         logging.info(f'received command : {cmd} ({chr(cmd)})')
 
         # check that cmd is right for this view
@@ -592,7 +844,11 @@ def library_controller(screen):
 
                 logging.info('Selecting article')
 
-                current_article = library.articles[view.selection_ind]
+                if (current_article := open_article(view)) is None:
+                    continue
+
+                # Keep showing the same articles, once back from this one
+                shown = view.shown
 
                 titlebar.title = f'Article Details'
 
@@ -600,6 +856,12 @@ def library_controller(screen):
                                    'b': 'return'}
                 cmdbar.status = ''
 
+                if pdf_prefetcher is not None:
+                    pdf_prefetcher.start(current_article)
+                    opened = time.monotonic()
+
+                fill_details(current_article, cmdbar)
+
                 view = DetailedView(content_window, current_article,
                                     curs_ind=view.curs_ind, page=view.page)
 
@@ -611,17 +873,24 @@ def library_controller(screen):
 
                 logging.info('Going back')
 
+                # Going straight back, the PDF is probably not wanted after all
+                if pdf_prefetcher is not None:
+                    if time.monotonic() - opened < CONFIG.prefetch_pdf_cancel:
+                        pdf_prefetcher.cancel(current_article)
+
                 current_article = None
 
                 titlebar.title = f'NASA ADS Library'
 
                 cmdbar.commands = {'z/x': 'Prev/Next Library',
-                                   '\u21B3': 'Select Article'}
+                                   '\u21B3': 'Select Article',
+                                   'D': 'Download all', 'h': 'Hide seen'}
 
                 cmdbar.status = 'Select an article for more details'
 
                 view = LibraryView(content_window, library,
-                                   curs_ind=view.curs_ind, page=view.page)
+                                   curs_ind=view.curs_ind, page=view.page,
+                                   hide_seen=hide_seen, keep=shown)
 
             # --------------------------------------------------------------
             # Change Library
@@ -637,19 +906,52 @@ def library_controller(screen):
 
                 id_ = library_map[mov(library_cycle)]
 
-                if date in cache:
+                # Load again any library which could only be partly loaded
+                if id_ in cache and cache[id_].failed_pages:
+                    del cache[id_]
+
+                if id_ in cache:
                     logging.info(f'reading this {id_=} from cache')
                     library = cache[id_]
 
                 else:
-                    library = Library(id_)
-                    cache.cache_results(id_, library)
+
+                    # Reuses the prefetch of this library, if in progress
+                    future = prefetcher.fetch(id_)
+
+                    if CONFIG.show_loading:
+                        view.loading_dialog(wait_thread(future))
+
+                    try:
+                        library = future.result()
+
+                    except APIResponseError as err:
+                        return flash_error(screen, ResponseErrorView,
+                                           content_window, err.response,
+                                           titlebar=titlebar, cmdbar=cmdbar)
 
                 titlebar.title = f'NASA ADS Library'
                 cmdbar.status = 'Select an article for more details'
 
                 view = LibraryView(content_window, library,
-                                   curs_ind=view.curs_ind, page=view.page)
+                                   curs_ind=view.curs_ind, page=view.page,
+                                   hide_seen=hide_seen)
+
+            # --------------------------------------------------------------
+            # Show or hide articles already seen
+            # --------------------------------------------------------------
+
+            elif cmd == HIDE_SEEN:
+
+                logging.info('Toggling seen articles')
+
+                hide_seen = not hide_seen
+
+                cmdbar.status = ('Hiding seen articles' if hide_seen
+                                 else 'Showing all articles')
+
+                view = LibraryView(content_window, library,
+                                   hide_seen=hide_seen)
 
             # --------------------------------------------------------------
             # Scroll through articles
@@ -687,9 +989,18 @@ def library_controller(screen):
 
                 logging.info('Downloading file')
 
+                # Downloaded in the background, polling for progress
+                downloads.submit(current_article)
+
                 cmdbar.status = 'Downloading file...'
-                current_article.download()
-                cmdbar.status = ''
+
+            elif cmd == DOWNLOAD_ALL:
+
+                logging.info('Downloading all files')
+
+                downloads.submit_all(library.articles)
+
+                cmdbar.status = 'Downloading all files...'
 
             elif cmd == ONLINE:
 
@@ -713,7 +1024,8 @@ def library_controller(screen):
             # have to recreate view due to fixed content sizes at inits
             if view.type == 'list':
                 view = LibraryView(content_window, library,
-                                   curs_ind=view.curs_ind, page=view.page)
+                                   curs_ind=view.curs_ind, page=view.page,
+                                   hide_seen=hide_seen, keep=view.shown)
 
             elif view.type == 'detailed':
                 view = DetailedView(content_window, current_article)
@@ -723,7 +1035,17 @@ def library_controller(screen):
         # ------------------------------------------------------------------
 
         elif cmd in EXIT_CMDS:
-            # do quitty stuff
+            # do quitty stuff, without waiting on any libraries still loading
+            prefetcher.close()
+
+            for lib in [library, *cache.values()]:
+                lib.close()
+
+            downloads.close()
+
+            if pdf_prefetcher is not None:
+                pdf_prefetcher.close()
+
             raise SystemExit
 
         # some other inconsequential cmd
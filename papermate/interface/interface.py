@@ -8,6 +8,8 @@ from curses import panel
 import logging
 
 from ..utils import CONFIG, READMARKERS
+from ..libraries import get_membership_index
+from ..seen import get_seen_index
 
 
 def humanize_date(date, relative=True):
@@ -182,10 +184,29 @@ class ListView:
 
     @property
     def selection_ind(self):
-        return sum(self.Narticles[:self.page]) + self.curs_ind
+        return self._offsets[self.page] + self.curs_ind
+
+    @property
+    def selection(self):
+        '''the article currently under the cursor, or None if no articles'''
+
+        if 0 <= (ind := self.selection_ind) < len(self._articles):
+            return self._articles[ind]
+
+        return None
+
+    @property
+    def empty_message(self):
+        return 'No unseen articles' if self.hide_seen else 'No articles found'
+
+    def mark_selection(self):
+        '''record the article under the cursor as having been seen'''
+
+        if self._seen is not None and (article := self.selection) is not None:
+            self._seen.mark_seen(article.bibcode)
 
     def __init__(self, window, date, query_res, *, curs_ind=0, page=0,
-                 show_query_col=True):
+                 show_query_col=True, hide_seen=False, keep=()):
 
         self.window = window
 
@@ -209,13 +230,60 @@ class ListView:
 
         self._query_res = query_res
 
-        # for each query, get all the actual text and stuff involved
-        # and figure out how many lines total are in it, so we can decide what
-        # to show on each page
-        self._pages, self.Narticles = [], []
+        # Articles already seen are dimmed, or hidden entirely. Those in
+        # `keep` (i.e. shown before this view was rebuilt) are never hidden,
+        # so that the cursor stays on the same article
+        self._seen, self.hide_seen = get_seen_index(), hide_seen
+        self._keep = keep
+
+        # Pages are only laid out once first needed, keeping the number of
+        # articles on each page, and the number before each page
+        self._pages, self.Narticles, self._offsets = [], [], [0]
+
+        # every article laid out so far, in order
+        self._articles = []
+
+        self._paginator, self._complete = self._paginate(), False
+
+        self._layout(self.page)
+
+        # The requested page may no longer exist (e.g. after a resize)
+        self.page = min(self.page, self.Npages - 1)
+
+        self.draw()
+
+    @property
+    def Npages(self):
+        '''number of pages laid out so far (i.e. all of them, once complete)'''
+        return len(self._pages)
+
+    @property
+    def shown(self):
+        '''the bibcodes of all articles laid out so far'''
+        return {article.bibcode for article in self._articles}
+
+    @property
+    def Nshown(self):
+        '''number of articles laid out so far'''
+        return self._offsets[-1]
+
+    @property
+    def page_label(self):
+        return f'pg. {self.page + 1}/{self.Npages if self._complete else "?"}'
+
+    def _paginate(self):
+        '''lay out articles onto pages, yielding each page once it is full
+
+        for each query, get all the actual text and stuff involved and figure
+        out how many lines total are in it, so we can decide what to show on
+        each page. Each page is yielded along with whether it is the last.
+        '''
+
+        saved = get_membership_index()
+
         content = {}
         Nline = 2
-        for query, results in query_res.items():
+        for query, results in self._query_res.items():
 
             logging.info(f'creating view for {query=}')
 
@@ -226,10 +294,7 @@ class ListView:
                     content[query] = None
 
                 else:
-                    self.Narticles.append(sum([len(arts) if arts else 0
-                                               for arts in content.values()]))
-
-                    self._pages.append(content)
+                    yield content, False
 
                     content = {query: None}
                     # Nline = 2 + para['Nlines'] + 2
@@ -242,6 +307,15 @@ class ListView:
 
                 logging.info(f'--creating view for {article=}')
 
+                seen = self._seen is not None and article.bibcode in self._seen
+
+                hidden = self.hide_seen and article.bibcode not in self._keep
+
+                if seen and hidden:
+                    continue
+
+                self._articles.append(article)
+
                 para = {}
 
                 title_width = self.width - len(article.bibcode) - 5
@@ -253,6 +327,9 @@ class ListView:
 
                 para['authors'] = article.short_authors(self.width)
                 para['bibcode'] = article.bibcode
+                para['saved'] = article.bibcode in saved
+                para['seen'] = seen
+                para['read'] = seen and self._seen.is_read(article.bibcode)
 
                 Nline += para['Nlines'] + 2
 
@@ -273,21 +350,30 @@ class ListView:
                     if not content[query]:
                         del content[query]
 
-                    self.Narticles.append(sum([len(arts) if arts else 0
-                                               for arts in content.values()]))
-
-                    self._pages.append(content)
+                    yield content, False
 
                     content = {query: [para]}
                     Nline = 2 + para['Nlines'] + 2
 
-        self.Narticles.append(sum([len(arts) if arts else 0
-                                   for arts in content.values()]))
-        self._pages.append(content)
+            # Every article of this query was hidden
+            if not content[query]:
+                content[query] = None
+                Nline += 2
+
+        yield content, True
 
-        self.Npages = len(self._pages)
+    def _layout(self, page):
+        '''lay out all pages up to (and including) `page`, if not already'''
 
-        self.draw()
+        while len(self._pages) <= page and not self._complete:
+
+            content, self._complete = next(self._paginator)
+
+            Narticles = sum(len(arts) for arts in content.values() if arts)
+
+            self._pages.append(content)
+            self.Narticles.append(Narticles)
+            self._offsets.append(self._offsets[-1] + Narticles)
 
     def draw(self):
         '''draw this page'''
@@ -307,9 +393,8 @@ class ListView:
 
         art_ind = 0
 
-        page_label = f'pg. {self.page + 1}/{self.Npages}'
-        self.window.addstr(y, self.max_width - len(page_label) - 2,
-                           page_label, cs.A_ITALIC)
+        self.window.addstr(y, self.max_width - len(self.page_label) - 2,
+                           self.page_label, cs.A_ITALIC)
 
         for query, articles in content.items():
 
@@ -335,7 +420,7 @@ class ListView:
 
                 # y += 2
 
-                self.window.addstr(y, x, 'No articles found')
+                self.window.addstr(y, x, self.empty_message)
 
                 y += 3
 
@@ -370,12 +455,28 @@ class ListView:
                 title_win = self.window.derwin(len(para['title']),
                                                self.width + 1, y, x)
 
+                # Dim articles which have already been seen
+                if para['seen']:
+                    title_attr, text_attr = cs.A_DIM, cs.A_DIM
+                else:
+                    title_attr, text_attr = cs.A_BOLD, cs.A_NORMAL
+
                 for ind, line in enumerate(para['title']):
-                    title_win.addstr(ind, 0, line, cs.A_BOLD)
+                    title_win.addstr(ind, 0, line, title_attr)
 
                 title_win.addstr(0, self.width - len(para['bibcode']),
                                  para['bibcode'], cs.A_UNDERLINE)
 
+                # Mark articles already saved in one of the user's libraries
+                if para['saved']:
+                    title_win.addstr(0, self.width - len(para['bibcode']) - 3,
+                                     '\u2605', cs.A_BOLD)
+
+                # Mark articles which have already been opened and read
+                if para['read']:
+                    title_win.addstr(0, self.width - len(para['bibcode']) - 5,
+                                     '\u2713')
+
                 y += len(para['title'])
 
                 # ----------------------------------------------------------
@@ -395,7 +496,7 @@ class ListView:
 
                 for ind, line in enumerate(para['abstract']):
                     try:
-                        abs_win.addstr(ind, 0, line)
+                        abs_win.addstr(ind, 0, line, text_attr)
                     except cs.error:
                         pass
 
@@ -429,6 +530,8 @@ class ListView:
 
             self.page += 1
 
+            self._layout(self.page)
+
             if set_cursor:
                 self.curs_ind = 0
 
@@ -443,6 +546,8 @@ class ListView:
                 if set_cursor:
                     self.curs_ind = self.Narticles[self.page] - 1
 
+        self.mark_selection()
+
         if redraw:
             self.draw()
 
@@ -485,6 +590,8 @@ class ListView:
                     self.curs_ind = self.Narticles[self.page] - 1
                     READMARKERS.mark(self.date)
 
+        self.mark_selection()
+
         if redraw:
             self.draw()
 
@@ -510,13 +617,18 @@ class LibraryView(ListView):
 
     type = 'library'
 
-    def __init__(self, window, library, *, curs_ind=0, page=0):
+    def __init__(self, window, library, *, curs_ind=0, page=0,
+                 hide_seen=False, keep=()):
         date = datetime.datetime.today()
 
         self.title = f'{library.name}'
 
+        # articles of the library loaded so far, more may still be arriving
+        self.Nloaded = len(library.articles)
+
         super().__init__(window, date, {library.query.id: library},
-                         curs_ind=curs_ind, page=page, show_query_col=False)
+                         curs_ind=curs_ind, page=page, show_query_col=False,
+                         hide_seen=hide_seen, keep=keep)
 
     def draw(self):
         '''draw this page'''
@@ -536,9 +648,8 @@ class LibraryView(ListView):
 
         art_ind = 0
 
-        page_label = f'pg. {self.page + 1}/{self.Npages}'
-        self.window.addstr(y, self.max_width - len(page_label) - 2,
-                           page_label, cs.A_ITALIC)
+        self.window.addstr(y, self.max_width - len(self.page_label) - 2,
+                           self.page_label, cs.A_ITALIC)
 
         for articles in content.values():
 
@@ -548,7 +659,7 @@ class LibraryView(ListView):
 
             if articles is None:
 
-                self.window.addstr(y, x, 'No articles found')
+                self.window.addstr(y, x, self.empty_message)
 
                 y += 3
 
@@ -576,12 +687,28 @@ class LibraryView(ListView):
                 title_win = self.window.derwin(len(para['title']),
                                                self.width + 1, y, x)
 
+                # Dim articles which have already been seen
+                if para['seen']:
+                    title_attr, text_attr = cs.A_DIM, cs.A_DIM
+                else:
+                    title_attr, text_attr = cs.A_BOLD, cs.A_NORMAL
+
                 for ind, line in enumerate(para['title']):
-                    title_win.addstr(ind, 0, line, cs.A_BOLD)
+                    title_win.addstr(ind, 0, line, title_attr)
 
                 title_win.addstr(0, self.width - len(para['bibcode']),
                                  para['bibcode'], cs.A_UNDERLINE)
 
+                # Mark articles already saved in one of the user's libraries
+                if para['saved']:
+                    title_win.addstr(0, self.width - len(para['bibcode']) - 3,
+                                     '\u2605', cs.A_BOLD)
+
+                # Mark articles which have already been opened and read
+                if para['read']:
+                    title_win.addstr(0, self.width - len(para['bibcode']) - 5,
+                                     '\u2713')
+
                 y += len(para['title'])
 
                 # ----------------------------------------------------------
@@ -601,7 +728,7 @@ class LibraryView(ListView):
 
                 for ind, line in enumerate(para['abstract']):
                     try:
-                        abs_win.addstr(ind, 0, line)
+                        abs_win.addstr(ind, 0, line, text_attr)
                     except cs.error:
                         pass
 
@@ -726,6 +853,16 @@ class DetailedView:
         info += self.article.wrap_property('read_count', self.abs_width,
                                            label=True)
 
+        # libraries already containing this article
+        libraries = get_membership_index().libraries(self.article.bibcode)
+
+        if libraries:
+            lbl = 'libraries = '
+            lines = tw.wrap(', '.join(libraries), self.abs_width - len(lbl))
+
+            info += [f'{lbl if i == 0 else (" " * len(lbl))} {line}'
+                     for i, line in enumerate(lines)]
+
         logging.info(info)
 
         info_width = max(map(len, info)) + 4
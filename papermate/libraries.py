@@ -0,0 +1,333 @@
+import os
+import json
+import atexit
+import logging
+import threading
+import collections
+
+from .utils import CONFIG, get_user_libraries, create_default_library
+from .utils import invalidate_user_libraries, ResultStore
+
+
+__all__ = ['add_bibcodes', 'in_library', 'LibraryQueue', 'get_library_queue',
+           'MembershipIndex', 'get_membership_index']
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+class MembershipIndex:
+    '''local index of which libraries already contain each bibcode
+
+    The index is filled by every library loaded, and updated with every
+    article added to a library. If a `ResultStore` is given, the index is also
+    kept on disk, and so includes all libraries loaded in earlier sessions.
+    '''
+
+    def __init__(self, store=None):
+
+        self.store = store
+
+        self._lock = threading.Lock()
+
+        # bibcode -> {library ids}, and library id -> library name
+        self._index, self.names = {}, {}
+
+        if store is not None:
+            for bibcode, library, name in store.get_memberships():
+                self._index.setdefault(bibcode, set()).add(library)
+                self.names[library] = name
+
+    def __contains__(self, bibcode):
+        '''whether this bibcode is in any known library'''
+        return bool(self._index.get(bibcode))
+
+    def contains(self, bibcode, library):
+        '''whether this bibcode is in the library (by id) `library`'''
+        return library in self._index.get(bibcode, ())
+
+    def libraries(self, bibcode):
+        '''the names of all known libraries containing this bibcode'''
+        with self._lock:
+            ids = self._index.get(bibcode, ())
+            return sorted(self.names.get(id_) or id_ for id_ in ids)
+
+    def update_library(self, library, name, bibcodes):
+        '''replace all bibcodes in `library` with those just loaded'''
+
+        bibcodes = set(bibcodes)
+
+        with self._lock:
+
+            for bibcode, libraries in self._index.items():
+                if bibcode not in bibcodes:
+                    libraries.discard(library)
+
+            for bibcode in bibcodes:
+                self._index.setdefault(bibcode, set()).add(library)
+
+            self.names[library] = name
+
+        if self.store is not None:
+            self.store.put_memberships(library, name, bibcodes, replace=True)
+
+    def add(self, library, name, bibcodes):
+        '''add bibcodes which have just been added to `library`'''
+
+        with self._lock:
+
+            for bibcode in bibcodes:
+                self._index.setdefault(bibcode, set()).add(library)
+
+            self.names[library] = name
+
+        if self.store is not None:
+            self.store.put_memberships(library, name, bibcodes)
+
+
+def get_membership_index():
+    '''return the single process-wide library membership index'''
+    global _INDEX
+
+    with _INDEX_LOCK:
+
+        if _INDEX is None:
+
+            store = None
+            if CONFIG.cache_results:
+                store = ResultStore(CONFIG.cache_file, ttl=CONFIG.cache_ttl)
+
+            _INDEX = MembershipIndex(store)
+
+    return _INDEX
+
+
+def in_library(bibcode, *, name='papermate'):
+    '''whether this bibcode is known to be already in the library `name`'''
+
+    # Checked by name, so that the library map (which may need requesting) is
+    # never needed here. `add_bibcodes` checks again by id, when adding
+    return name in get_membership_index().libraries(bibcode)
+
+
+def add_bibcodes(bibcodes, *, name='papermate', _retry=True):
+    '''add a number of bibcodes to the library `name`, in a single request
+
+    returns the number of bibcodes actually added (i.e. not already in it)
+    '''
+    import ads.libraries
+
+    library_map = get_user_libraries()
+
+    if name not in library_map:
+        library_map |= create_default_library()
+
+    id_ = library_map[name]
+
+    index = get_membership_index()
+
+    # Skip any bibcodes already known to be in this library
+    bibcodes = [bib for bib in bibcodes if not index.contains(bib, id_)]
+
+    if not bibcodes:
+        logging.info(f'All bibcodes already in library {name}, skipping')
+        return 0
+
+    # giving the name skips requesting the library metadata
+    lib = ads.libraries.Library(id_, name=name)
+
+    resp = lib.add_documents(bibcodes)
+
+    if resp == -1:
+
+        # The cached library map may be out of date, refresh and retry
+        invalidate_user_libraries()
+
+        if _retry:
+            return add_bibcodes(bibcodes, name=name, _retry=False)
+
+        mssg = f"Could not add to library '{name}'."
+        raise ValueError(mssg)
+
+    index.add(id_, name, bibcodes)
+
+    return resp
+
+
+class LibraryQueue:
+    '''write-behind queue of bibcodes waiting to be added to libraries
+
+    Bibcodes are collected (per library) and added in one batched request per
+    library, every `interval` seconds and on exit. Every queued add is first
+    written to a journal file, so that any not yet sent when papermate crashes
+    are sent the next time it is started.
+
+    Any messages about sent (or failed) batches are kept in `messages`.
+    '''
+
+    def __init__(self, journal, *, interval=30):
+
+        self.journal = journal
+
+        self.interval = interval
+
+        self.messages = collections.deque()
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._pending = {}
+
+        self._replay()
+
+        self._stop = threading.Event()
+
+        self._timer = threading.Thread(target=self._run, daemon=True)
+        self._timer.start()
+
+    def __len__(self):
+        with self._lock:
+            return sum(map(len, self._pending.values()))
+
+    @property
+    def idle(self):
+        '''whether nothing is queued, being sent, or waiting to be reported'''
+        return not (len(self) or self._flush_lock.locked() or self.messages)
+
+    def _replay(self):
+        '''queue again all adds left in the journal by a previous session'''
+
+        try:
+            with open(self.journal) as file:
+                entries = [json.loads(line) for line in file if line.strip()]
+
+        except FileNotFoundError:
+            return
+
+        except ValueError as err:
+            logging.warning(f'Could not read library journal: {err}')
+            return
+
+        for entry in entries:
+            library = self._pending.setdefault(entry['library'], {})
+            library[entry['bibcode']] = None
+
+        if entries:
+            logging.info(f'Replaying {len(entries)} queued library adds')
+
+    def _write_journal(self):
+        '''rewrite the journal to hold only the currently pending adds'''
+
+        tmp = f'{self.journal}.tmp'
+
+        with open(tmp, 'w') as file:
+            for name, bibcodes in self._pending.items():
+                for bibcode in bibcodes:
+                    entry = {'library': name, 'bibcode': bibcode}
+                    file.write(json.dumps(entry) + '\n')
+
+        os.replace(tmp, self.journal)
+
+    def add(self, bibcode, *, name='papermate'):
+        '''queue the bibcode to be added to library `name`'''
+
+        with self._lock:
+
+            library = self._pending.setdefault(name, {})
+
+            if bibcode in library:
+                return
+
+            library[bibcode] = None
+
+            with open(self.journal, 'a') as file:
+                entry = {'library': name, 'bibcode': bibcode}
+                file.write(json.dumps(entry) + '\n')
+
+    def flush(self):
+        '''send all pending adds, in one request per library'''
+        import requests
+
+        with self._flush_lock:
+
+            with self._lock:
+                batches, self._pending = self._pending, {}
+
+            if not batches:
+                return
+
+            for name, bibcodes in batches.items():
+
+                if not bibcodes:
+                    continue
+
+                try:
+                    Nadded = add_bibcodes(bibcodes, name=name)
+
+                except requests.RequestException as err:
+                    # Could not reach ADS, keep these queued to try again
+                    logging.warning(f'Could not add to library {name}: {err}')
+
+                    with self._lock:
+                        library = self._pending.setdefault(name, {})
+                        self._pending[name] = bibcodes | library
+
+                    self.messages.append(
+                        f'Could not reach ADS, {len(bibcodes)} articles '
+                        f'still queued for library'
+                    )
+                    continue
+
+                except Exception as err:
+                    logging.warning(f'Could not add to library {name}: {err}')
+
+                    self.messages.append(str(err))
+                    continue
+
+                logging.info(f'Added {Nadded}/{len(bibcodes)} to {name}')
+
+                mssg = f"Added {Nadded} articles to library '{name}'"
+
+                if (Nexisting := len(bibcodes) - Nadded) > 0:
+                    mssg += f' ({Nexisting} already in it)'
+
+                self.messages.append(mssg)
+
+            with self._lock:
+                self._write_journal()
+
+    def pop_message(self):
+        '''return the oldest waiting message, or None'''
+        try:
+            return self.messages.popleft()
+        except IndexError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        '''stop flushing periodically, and send any remaining adds'''
+        self._stop.set()
+        self.flush()
+
+
+def get_library_queue():
+    '''return the single process-wide library queue, flushed on exit'''
+    global _QUEUE
+
+    with _QUEUE_LOCK:
+
+        if _QUEUE is None:
+
+            _QUEUE = LibraryQueue(CONFIG.library_journal,
+                                  interval=CONFIG.library_flush_interval)
+
+            atexit.register(_QUEUE.close)
+
+    return _QUEUE
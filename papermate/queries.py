@@ -1,15 +1,25 @@
 import ads
 import ads.libraries
+import requests
 
+import json
+import time
 import logging
 import datetime
+import functools
 import itertools
+import threading
 
 from .articles import Article
-from .utils import _Config
+from .utils import _Config, DaemonExecutor, ResultStore
+from .libraries import get_membership_index
+from .connections import share_with_ads
 
 
-__all__ = ['Query', 'QuerySet', 'Library']
+__all__ = ['Query', 'QuerySet', 'Library', 'load_details']
+
+
+share_with_ads()
 
 
 second_order_operations = (
@@ -35,6 +45,11 @@ def _gen_q(**search_terms):
 
 
 class _Searcher(ads.SearchQuery):
+    '''SearchQuery which collects the raw solr documents (dicts) of each page
+
+    Building `ads.search.Article`s for every document is skipped entirely,
+    iterating over this gives the documents, to be used in `Article.from_doc`.
+    '''
 
     _session_response = None
 
@@ -48,8 +63,7 @@ class _Searcher(ads.SearchQuery):
         # Only difference from SearchQuery.execute:
         resp = self.session.get(self.HTTP_ENDPOINT, params=self.query)
         # TODO this still fails grossly if receiving 503? fails on resp.json()
-        logging.warning(resp.text)
-        logging.warning(resp.json())
+        logging.info(f'received {resp.status_code} response from {resp.url}')
         try:
             self.response = ads.search.SolrResponse.load_http_response(resp)
         except ads.exceptions.APIResponseError as err:
@@ -63,7 +77,13 @@ class _Searcher(ads.SearchQuery):
             warnings.warn("Response rows did not match input rows. "
                           f"Setting this query's rows to {self.query['rows']}")
 
-        self._articles.extend(self.response.articles)
+        # ensure all fields in the "fl" are in the docs, as in `ads` (#38)
+        docs = self.response.docs
+        for doc in docs:
+            for field in self.response.fl:
+                doc.setdefault(field, None)
+
+        self._articles.extend(docs)
         if self._query.get('start') is not None:
             self._query['start'] += self._query['rows']
         elif self._query.get('cursorMark') is not None:
@@ -71,6 +91,39 @@ class _Searcher(ads.SearchQuery):
 
         self._highlights.update(self.response.json.get("highlighting", {}))
 
+    def stream(self, max_results=None):
+        '''yield documents page by page, following the cursorMark
+
+        Pages are only requested as the documents of the previous page are
+        consumed, until all documents found (or `max_results`) have been given.
+        '''
+
+        if self.response is None:
+            self.execute()
+
+        ind = 0
+
+        while True:
+
+            for doc in self._articles[ind:]:
+
+                if max_results is not None and ind >= max_results:
+                    return
+
+                yield doc
+                ind += 1
+
+            finished = (len(self._articles) >= self.response.numFound
+                        or not self.response.docs
+                        or self._query.get('cursorMark') is None)
+
+            if finished:
+                return
+
+            logging.info(f'streaming next page ({self.progress})')
+
+            self.execute()
+
 
 class Query:
     '''all the things that go into making an ADS query
@@ -85,9 +138,19 @@ class Query:
         'page', 'read_count'
     ]
 
+    # only the fields required to list articles, details are loaded later
+    _light_fl = [f for f in _fl if f not in Article._detail_fields]
+
+    # maximum rows per page allowed by ADS, used for searching date ranges
+    _range_rows = 2000
+
     def __str__(self):
         return f'{self.name} - {self.arxiv_class}'
 
+    def _store_key(self, fl):
+        '''a consistent string identifying this query, for storing results'''
+        return json.dumps([self._query_dict, fl], sort_keys=True)
+
     def column_str(self, width=30):
         import textwrap as tw
 
@@ -131,33 +194,229 @@ class Query:
             **search_terms
         )
 
-    def execute(self, date=None):
+    def execute(self, date=None, *, store=None, stream=False,
+                max_results=None, light=False):
+        '''search for this query on the given date (today by default)
+
+        if `light`, only the fields required to list the articles are
+        requested, and the details must be filled in using `load_details`.
+
+        if a `ResultStore` is given, unexpired stored results are used
+        instead of searching, and new results are added to the store.
+
+        if `stream`, only the first page of results is requested here, and
+        further pages (up to `max_results` articles) are requested as the
+        returned `QueryResult` is iterated over.
+        '''
 
         if date is None:
             date = datetime.datetime.today()
 
         entdate = f'{date:%Y-%m-%d}z00:00'
 
-        result = _Searcher(entdate=entdate, fl=self._fl, **self._query_dict)
+        fl = self._light_fl if light else self._fl
+
+        key = self._store_key(fl)
+
+        if store is not None:
+
+            if (docs := store.get(key, entdate)) is not None:
+                logging.info(f'reading {self.name} ({entdate=}) from store')
+                return QueryResult(self, docs)
+
+        result = _Searcher(entdate=entdate, fl=fl, **self._query_dict)
 
         result.execute()
 
-        return QueryResult(self, result)
+        if stream:
+            docs = result.stream(max_results)
+
+            if store is not None:
+                docs = _store_on_completion(docs, store, key, entdate)
+
+        else:
+            docs = list(result)
+
+            if store is not None:
+                store.put(key, entdate, docs)
+
+        return QueryResult(self, docs, response=result.response)
+
+    def count(self, date=None):
+        '''count the articles found on the given date, without loading them'''
+
+        if date is None:
+            date = datetime.datetime.today()
+
+        entdate = f'{date:%Y-%m-%d}z00:00'
+
+        result = _Searcher(entdate=entdate, fl=[], **self._query_dict)
+
+        # ads requires rows > 0, but only the total (numFound) is needed
+        result._query['rows'] = 0
+
+        result.execute()
+
+        return result.response.numFound
+
+    def execute_range(self, start, end=None, *, store=None, light=False):
+        '''search for this query over a range of dates, in a single search
+
+        all articles entered between `start` and `end` (today by default) are
+        paged through, and split into a `QueryResult` for each day in the
+        range, which are returned in a dict, and added to the store, if given.
+        '''
+
+        if end is None:
+            end = datetime.datetime.today()
+
+        start, end = _midnight(start), _midnight(end)
+
+        fl = self._light_fl if light else self._fl
+
+        key = self._store_key(fl)
+
+        entdate = f'([{start:%Y-%m-%d} TO {end:%Y-%m-%d}])'
+
+        result = _Searcher(entdate=entdate, fl=fl + ['entdate'],
+                           rows=self._range_rows, **self._query_dict)
+
+        days = {}
+
+        for doc in result.stream():
+            day = datetime.datetime.strptime(doc['entdate'][:10], '%Y-%m-%d')
+            days.setdefault(day, []).append(doc)
+
+        results = {}
+
+        for ind in range((end - start).days + 1):
+
+            day = start + datetime.timedelta(days=ind)
+            docs = days.get(day, [])
+
+            if store is not None:
+                store.put(key, f'{day:%Y-%m-%d}z00:00', docs)
+
+            results[day] = QueryResult(self, docs)
+
+        return results
+
+
+def _midnight(date):
+    '''the (naive) datetime at the start of the given date'''
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+def _store_on_completion(docs, store, key, entdate):
+    '''pass through streamed documents, storing them all once finished'''
+
+    stored = []
+
+    for doc in docs:
+        stored.append(doc)
+        yield doc
+
+    store.put(key, entdate, stored)
+
+
+def load_details(articles):
+    '''fill in the details of any (lightly loaded) articles, in one request'''
+
+    missing = {a.bibcode: a for a in articles if not a.detailed}
+
+    if not missing:
+        return
+
+    bibcodes = ' OR '.join(f'"{bibcode}"' for bibcode in missing)
+
+    result = _Searcher(q=f'bibcode:({bibcodes})', rows=len(missing),
+                       fl=['bibcode', *Article._detail_fields])
+
+    result.execute()
+
+    for doc in result:
+        if (article := missing.get(doc['bibcode'])) is not None:
+            article.add_details(doc)
 
 
 class QueryResult:
+    '''the articles found by a query
+
+    `docs` may be a list of raw solr documents, which are all made into
+    articles at once, or any iterable of them, including a lazy stream of
+    results, in which case articles are only loaded as they are iterated over
+    (or all at once when accessing `articles`). If requesting the next page of
+    a stream fails, the stream is ended there, keeping all articles already
+    loaded, and the failure kept in `error`.
+    '''
 
     def __iter__(self):
-        yield from self.articles
 
-    def __init__(self, query, result):
+        ind = 0
+
+        while True:
+
+            with self._lock:
+                if ind >= len(self._articles) and not self._load_next():
+                    return
+
+            yield self._articles[ind]
+            ind += 1
+
+    def __init__(self, query, docs, *, response=None):
 
         self.query = query
-        self.articles = [Article(a) for a in result]
 
-        self.empty = len(self.articles) == 0
+        if isinstance(docs, list):
+            self._articles = Article.from_docs(docs)
+            self._docs = None
+
+        else:
+            self._articles = []
+            self._docs = iter(docs)
+
+        self._lock = threading.Lock()
+
+        self.response = response
+
+        self.error = None
+
+    def _load_next(self):
+        '''load the next article from the documents, False if none remain'''
+
+        if self._docs is None:
+            return False
+
+        try:
+            self._articles.append(Article.from_doc(next(self._docs)))
+            return True
+
+        except StopIteration:
+            self._docs = None
+            return False
+
+        except (ads.exceptions.APIResponseError,
+                requests.RequestException) as err:
 
-        self.response = result.response
+            logging.warning(f'failed to stream results of {self.query}: {err}')
+
+            self._docs, self.error = None, err
+            return False
+
+    @property
+    def articles(self):
+
+        with self._lock:
+            while self._load_next():
+                pass
+
+        return self._articles
+
+    @property
+    def empty(self):
+
+        with self._lock:
+            return not self._articles and not self._load_next()
 
 
 class QuerySet:
@@ -171,19 +430,80 @@ class QuerySet:
 
     @classmethod
     def from_configfile(cls, config: _Config):
+
+        store = None
+        if config.cache_results:
+            store = ResultStore(config.cache_file, ttl=config.cache_ttl)
+
+        max_results = config.max_results if config.stream_results else None
+
         return cls([Query(name=name, **sec)
-                    for name, sec in config.queries.items()])
+                    for name, sec in config.queries.items()],
+                   max_workers=config.query_workers, store=store,
+                   stream=config.stream_results, max_results=max_results,
+                   light=config.light_fields)
 
-    def __init__(self, queries):
+    def __init__(self, queries, *, max_workers=1, store=None,
+                 stream=False, max_results=None, light=False):
 
         self.queries = queries
 
+        self.max_workers = max_workers
+        self.store = store
+
+        self.stream = stream
+        self.max_results = max_results
+
+        self.light = light
+
+    def _map(self, func):
+        '''call func on each query, concurrently if allowed multiple workers
+
+        results are always given in the order of the queries, regardless of
+        the order in which the requests finish
+        '''
+
+        if self.max_workers is None or self.max_workers <= 1:
+            return [func(q) for q in self.queries]
+
+        Nworkers = min(self.max_workers, len(self.queries)) or 1
+
+        # Daemon workers, so that exiting never waits on these queries
+        with DaemonExecutor(Nworkers) as pool:
+            return list(pool.map(func, self.queries))
+
     def execute(self, date=None):
-        self.results = QuerySetResult(
-            [q.execute(date=date) for q in self.queries]
-        )
+        '''execute all queries, concurrently if allowed more than one worker'''
+
+        results = self._map(lambda q: q.execute(
+            date=date, store=self.store, stream=self.stream,
+            max_results=self.max_results, light=self.light
+        ))
+
+        self.results = QuerySetResult(results)
         return self.results
 
+    def count(self, date=None):
+        '''total number of articles found by all queries on the given date'''
+        return sum(self._map(lambda q: q.count(date=date)))
+
+    def execute_range(self, start, end=None):
+        '''execute all queries over a range of dates, with one search each
+
+        returns a dict of `QuerySetResult`s for each day from `start` to `end`
+        (today by default), which can be added directly to a `DateCache`
+        '''
+
+        query_results = self._map(lambda q: q.execute_range(
+            start, end, store=self.store, light=self.light
+        ))
+
+        if not query_results:
+            return {}
+
+        return {day: QuerySetResult([res[day] for res in query_results])
+                for day in query_results[0]}
+
 
 class QuerySetResult:
     '''The results of a QuerySet being executed'''
@@ -198,11 +518,25 @@ class QuerySetResult:
 
         self.queries = [r.query for r in results]
         self.results = results
-        self.articles = list(itertools.chain(*[r.articles for r in results]))
+
+    @property
+    def articles(self):
+        return list(itertools.chain(*[r.articles for r in self.results]))
+
+    @property
+    def errors(self):
+        '''the errors which ended the streams of any of the results'''
+        return [r.error for r in self.results if r.error is not None]
 
 
 class Library(QueryResult):
     '''Note that this is based on a query and so is *read-only*
+
+    Only the first page of documents is loaded before initialization returns,
+    any further pages are requested in parallel in the background and their
+    articles appended (in order) as they arrive, while `loading` is True.
+    Any page which still fails after a number of attempts is skipped, and
+    listed in `failed_pages`, in which case the library is never stored.
     '''
 
     _fl = [
@@ -212,6 +546,15 @@ class Library(QueryResult):
         'page', 'read_count'
     ]
 
+    _light_fl = [f for f in _fl if f not in Article._detail_fields]
+
+    # documents per page, and a stable sort so that pages never overlap
+    _page_rows = 500
+    _sort = 'date desc,bibcode desc'
+
+    # number of times to try requesting each page
+    _page_attempts = 3
+
     @property
     def name(self):
         return self.query.metadata['name']
@@ -220,12 +563,159 @@ class Library(QueryResult):
     def description(self):
         return self.query.metadata['description']
 
-    def __init__(self, id_):
+    @property
+    def loading(self):
+        '''whether any pages have not yet been appended (or skipped)'''
+        return self._next_page < self._Npages
+
+    @property
+    def complete(self):
+        '''whether every page of this library has been loaded'''
+        return not self.loading and not self.failed_pages
+
+    def __init__(self, id_, *, light=False, store=None, max_workers=4):
+        '''load the library `id_`
+
+        if a `ResultStore` is given, the stored documents of this library are
+        used as long as the library has not changed since they were stored
+        '''
 
+        # Only the library metadata is retrieved here
         lib = ads.libraries.Library(id_)
 
-        result = lib.get_documents(fl=self._fl)
+        # the next page to be appended, of the total number of pages
+        self._next_page, self._Npages = 1, 1
 
-        result.execute()
+        self.failed_pages = []
+
+        # pool loading the remaining pages, if any
+        self._pool = None
+
+        fl = self._light_fl if light else self._fl
+
+        key = json.dumps([id_, fl])
+
+        if store is not None:
+
+            if (docs := store.get_library(key, lib.metadata)) is not None:
+                logging.info(f'reading library {id_} from store')
+                super().__init__(lib, docs)
+                self._index(docs)
+                return
+
+        result = self._search_page(id_, fl, start=0)
+
+        docs = list(result)
+
+        super().__init__(lib, docs, response=result.response)
+
+        Npages = -(-result.response.numFound // self._page_rows)
+
+        if Npages <= 1:
+
+            if store is not None:
+                store.put_library(key, lib.metadata, docs)
+
+            self._index(docs)
+
+            return
+
+        logging.info(f'loading remaining {Npages - 1} pages of library {id_}')
+
+        self._Npages = Npages
+
+        # Pages (by index) which have arrived, but not yet been appended
+        self._arrived = {}
+        self._all_docs = docs
+
+        def append_page(page, future):
+
+            # Closed before this page was requested
+            if future.cancelled():
+                return
+
+            try:
+                page_docs = list(future.result())
+
+            except Exception as err:
+                logging.warning(f'failed to load page {page} of {id_}: {err}')
+
+                # Skip this page, so that all later pages are still appended
+                with self._lock:
+                    self.failed_pages.append(page)
+
+                page_docs = []
+
+            with self._lock:
+
+                self._arrived[page] = page_docs
+
+                while self._next_page in self._arrived:
+                    new = self._arrived.pop(self._next_page)
+
+                    self._articles.extend(Article.from_docs(new))
+                    self._all_docs.extend(new)
+
+                    self._next_page += 1
+
+                if self._next_page == Npages:
+
+                    # A library missing pages is neither stored nor indexed
+                    if not self.failed_pages:
+
+                        if store is not None:
+                            store.put_library(key, lib.metadata,
+                                              self._all_docs)
+
+                        self._index(self._all_docs)
+
+                    self._all_docs = None
+
+        # Daemon workers, so that exiting never waits on the remaining pages
+        self._pool = DaemonExecutor(max_workers)
+
+        for page in range(1, Npages):
+
+            fut = self._pool.submit(self._search_page, id_, fl,
+                                    start=page * self._page_rows,
+                                    attempts=self._page_attempts)
+
+            fut.add_done_callback(functools.partial(append_page, page))
+
+        self._pool.shutdown(wait=False)
+
+    def close(self):
+        '''stop loading any pages of this library not yet requested'''
+
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _index(self, docs):
+        '''record the (complete) contents of this library in the local index'''
+
+        bibcodes = [doc['bibcode'] for doc in docs]
+
+        get_membership_index().update_library(self.query.id, self.name,
+                                              bibcodes)
+
+    def _search_page(self, id_, fl, *, start, attempts=1):
+        '''search for one page of this library's documents'''
+
+        for attempt in range(1, attempts + 1):
+
+            result = _Searcher(q=f'docs(library/{id_})', fl=fl,
+                               sort=self._sort, start=start,
+                               rows=self._page_rows)
+
+            try:
+                result.execute()
+                return result
+
+            except Exception as err:
+
+                if attempt == attempts:
+                    raise
+
+                logging.warning(f'retrying library {id_} from {start}: {err}')
 
-        super().__init__(lib, result)
+                time.sleep(attempt)
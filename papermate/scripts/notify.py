@@ -1,17 +1,12 @@
 #!/usr/bin/env python3
 
-import papermate
 from papermate.utils import CONFIG
 
 import os
-import logging
 import warnings
 import subprocess
 
 
-logging.basicConfig(filename=CONFIG.log_file, filemode='w', level=logging.DEBUG)
-
-
 def _notify_wall(notif, banner=False, timeout=None):
     '''Raise a notification using the `wall` command.'''
 
@@ -46,8 +41,10 @@ def broadcast_reminder(method='wall', show_count=True):
     mssg = f"PAPERMATE REMINDER - "
 
     if show_count:
-        res = papermate.queries.QuerySet.from_configfile(CONFIG).execute()
-        count = len(res.articles)
+        # Only imported here, as the queries require the (slow) `ads` package
+        from papermate.queries import QuerySet
+
+        count = QuerySet.from_configfile(CONFIG).count()
 
         mssg += f"{count} new articles to read today!"
 
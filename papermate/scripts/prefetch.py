@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''warm the stored query results for a range of previous days'''
+
+from papermate.utils import CONFIG
+
+import sys
+import argparse
+import datetime
+
+
+def parse_since(value):
+    '''parse either a date (YYYY-MM-DD) or a number of days ago'''
+
+    try:
+        days = int(value)
+        return datetime.datetime.today() - datetime.timedelta(days=days)
+
+    except ValueError:
+        return datetime.datetime.fromisoformat(value)
+
+
+def prefetch(since):
+    '''search for all queries on every day since `since`, storing results'''
+
+    # Only imported here, as the queries require the (slow) `ads` package
+    from papermate.queries import QuerySet
+
+    queries = QuerySet.from_configfile(CONFIG)
+
+    if queries.store is None:
+        mssg = "Prefetching requires the 'cache_results' setting to be enabled"
+        raise RuntimeError(mssg)
+
+    results = queries.execute_range(since)
+
+    for day, res in results.items():
+        sys.stdout.write(f"{day:%Y-%m-%d} : {len(res.articles)} articles\n")
+
+
+def main():
+
+    # ----------------------------------------------------------------------
+    # Command line argument parsing
+    # ----------------------------------------------------------------------
+
+    parser = argparse.ArgumentParser(
+        description='Search for, and store, the articles of previous days.'
+    )
+
+    parser.add_argument('--since', type=parse_since, default='7',
+                        help=('Date (YYYY-MM-DD) or number of days ago to '
+                              'start from (default: 7)'))
+
+    args = parser.parse_args()
+
+    prefetch(args.since)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import os
+import fcntl
+import pathlib
+import threading
+import contextlib
+
+from .utils import CONFIG
+
+
+__all__ = ['SeenIndex', 'get_seen_index']
+
+
+_SEEN = None
+_SEEN_LOCK = threading.Lock()
+
+
+class SeenIndex:
+    '''on-disk index of which articles have been seen, or read, by bibcode
+
+    Each bibcode is interned once, its integer ID being its line number in
+    `bibcodes.txt`, and its state kept as a single byte of flags at that
+    offset in `flags.bin`. Both are read into memory only once, so checking an
+    article is a dict and array lookup, however many are tracked. Each mark
+    is written straight to disk under a file lock, so that any number of
+    sessions may share the same index.
+    '''
+
+    SEEN, READ = 1, 2
+
+    def __init__(self, root):
+
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self.bibcode_file = self.root / 'bibcodes.txt'
+        self.flag_file = self.root / 'flags.bin'
+
+        self._lock = threading.Lock()
+
+        # bibcode -> ID, and the bytes of `bibcode_file` read into it so far
+        self._ids, self._offset = {}, 0
+
+        with self._lock, self._file_lock():
+
+            self._read_bibcodes()
+
+            try:
+                self._flags = bytearray(self.flag_file.read_bytes())
+            except FileNotFoundError:
+                self._flags = bytearray()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        '''exclusive lock on the index files, across processes'''
+
+        with open(self.root / '.lock', 'a') as lf:
+
+            fcntl.flock(lf, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _read_bibcodes(self):
+        '''intern any bibcodes added to the file (by any process) since read'''
+
+        try:
+            with open(self.bibcode_file, 'rb') as file:
+                file.seek(self._offset)
+                new = file.read()
+
+        except FileNotFoundError:
+            return
+
+        for bibcode in new.decode().splitlines():
+            self._ids[bibcode] = len(self._ids)
+
+        self._offset += len(new)
+
+    def _intern(self, bibcode):
+        '''the ID of this bibcode, adding it if new (file lock must be held)'''
+
+        if bibcode not in self._ids:
+
+            # Another session may have since added it, or others before it
+            self._read_bibcodes()
+
+            if bibcode not in self._ids:
+
+                line = f'{bibcode}\n'.encode()
+
+                with open(self.bibcode_file, 'ab') as file:
+                    file.write(line)
+
+                self._ids[bibcode] = len(self._ids)
+                self._offset += len(line)
+
+        return self._ids[bibcode]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, bibcode):
+        '''whether this bibcode has been seen'''
+        return bool(self.flags(bibcode) & self.SEEN)
+
+    def flags(self, bibcode):
+        '''the flags (`SEEN` and `READ`) set for this bibcode'''
+
+        id_ = self._ids.get(bibcode)
+
+        if id_ is None or id_ >= len(self._flags):
+            return 0
+
+        return self._flags[id_]
+
+    def is_read(self, bibcode):
+        '''whether this bibcode has been opened and read'''
+        return bool(self.flags(bibcode) & self.READ)
+
+    def mark(self, bibcode, flags):
+        '''set these `flags` for the bibcode, in memory and on disk'''
+
+        if self.flags(bibcode) & flags == flags:
+            return
+
+        with self._lock, self._file_lock():
+
+            id_ = self._intern(bibcode)
+
+            fd = os.open(self.flag_file, os.O_RDWR | os.O_CREAT, 0o644)
+
+            try:
+                # Keep any flags set by another session
+                value = (os.pread(fd, 1, id_) or b'\0')[0] | flags
+                os.pwrite(fd, bytes([value]), id_)
+
+            finally:
+                os.close(fd)
+
+            if id_ >= len(self._flags):
+                self._flags.extend(bytes(id_ + 1 - len(self._flags)))
+
+            self._flags[id_] = value
+
+    def mark_seen(self, bibcode):
+        '''mark this bibcode as seen (e.g. selected in a listing)'''
+        self.mark(bibcode, self.SEEN)
+
+    def mark_read(self, bibcode):
+        '''mark this bibcode as read (i.e. its details opened), and seen'''
+        self.mark(bibcode, self.SEEN | self.READ)
+
+
+def get_seen_index():
+    '''return the single process-wide seen index, or None if disabled'''
+    global _SEEN
+
+    with _SEEN_LOCK:
+
+        if _SEEN is None and CONFIG.track_seen:
+            _SEEN = SeenIndex(pathlib.Path(CONFIG.seen_index).expanduser())
+
+    return _SEEN
@@ -1,8 +1,16 @@
 import os
+import json
+import time
+import queue
+import fcntl
 import shutil
 import pathlib
 import logging
+import sqlite3
 import datetime
+import threading
+import contextlib
+import concurrent.futures
 from collections import UserDict
 
 try:
@@ -11,9 +19,11 @@ except ImportError:
     import tomli as toml
 
 
-__all__ = ['CONFIG', 'prev', 'BidirectionalCycler',
-           'get_user_libraries', 'create_default_library',
-           'Cache', 'DateCache', 'READMARKERS']
+__all__ = ['CONFIG', 'prev', 'BidirectionalCycler', 'step_date',
+           'get_user_libraries', 'invalidate_user_libraries',
+           'create_default_library',
+           'Cache', 'DateCache', 'DaemonExecutor', 'Prefetcher', 'ResultStore',
+           'READMARKERS']
 
 
 # --------------------------------------------------------------------------
@@ -56,6 +66,65 @@ def remove_cronjob(cron=None, *, strict=False):
 
     cron.write()
 
+
+CRON_STAMP_PATH = pathlib.Path.home() / ".local/share/pmate_cron.json"
+
+
+def _job_matches(jobs, days, hours):
+    '''whether `jobs` is exactly the single job that `setup_cronjob` makes'''
+    import crontab
+
+    if len(jobs) != 1:
+        return False
+
+    wanted = crontab.CronTab(tab='').new(command='papermate-remind')
+
+    wanted.dow.on(*days)
+    wanted.hour.on(*hours)
+    wanted.minute.on(0)
+
+    return (str(jobs[0].slices) == str(wanted.slices)
+            and jobs[0].command == shutil.which('papermate-remind'))
+
+
+def sync_cronjob(reminder_times=None, *, stamp=CRON_STAMP_PATH):
+    '''make the reminder cronjob match `reminder_times`, or remove it if None
+
+    The crontab is only read when the reminder settings have changed since
+    they were last synced (as recorded in `stamp`), and only written when it
+    does not already match them.
+    '''
+
+    state = json.dumps(reminder_times)
+
+    try:
+        if stamp.read_text() == state:
+            return
+    except OSError:
+        pass
+
+    import crontab
+
+    cron = crontab.CronTab(user=True)
+
+    jobs = list(cron.find_command('papermate-remind'))
+
+    if reminder_times is None:
+
+        if jobs:
+            remove_cronjob(cron=cron)
+
+    elif not _job_matches(jobs, *reminder_times):
+
+        logging.info(f'setting up cronjob with {reminder_times=}')
+
+        setup_cronjob(*reminder_times, cron=cron, overwrite=True)
+
+    try:
+        stamp.write_text(state)
+    except OSError as err:
+        logging.warning(f'Could not record cronjob settings: {err}')
+
 # --------------------------------------------------------------------------
 # Application settings
 # --------------------------------------------------------------------------
@@ -67,14 +136,38 @@ SETTINGS_DEFAULTS = {
     "skip_weekends": True,
     "default_library": "papermate",
     "download_location": pathlib.Path.home() / "Downloads",
+    "pdf_store": pathlib.Path.home() / ".local/share/pmate_pdfs",
     "log_file": pathlib.Path.home() / ".local/share/pmate.log",
+    "cache_results": True,
+    "cache_file": pathlib.Path.home() / ".local/share/pmate_cache.sqlite",
+    "cache_ttl": 24,
+    "library_map_ttl": 24,
+    "batch_library_adds": True,
+    "library_flush_interval": 30,
+    "library_journal": pathlib.Path.home() / ".local/share/pmate_adds.jsonl",
     "show_relative_date": True,
     "show_loading": True,
     "mark_read": True,
+    "track_seen": True,
+    "hide_seen": False,
+    "seen_index": pathlib.Path.home() / ".local/share/pmate_seen",
     "ads_api_key": None,
     "reminder": False,
     "reminder_times": [["Mon", "Tue", "Wed", "Thu", "Fri"], [9]],
-    "invert_colours": False
+    "invert_colours": False,
+    "http_timeout": 30,
+    "http_pool_size": 10,
+    "download_workers": 4,
+    "pdf_sources": ["EPRINT_PDF", "arXiv", "PUB_PDF"],
+    "pdf_hedge_delay": 1.0,
+    "prefetch_pdfs": False,
+    "prefetch_pdf_cancel": 5,
+    "prefetch_pdf_size": 200,
+    "query_workers": 4,
+    "stream_results": False,
+    "light_fields": False,
+    "max_results": 1000,
+    "prefetch_days": 2
 }
 
 
@@ -96,8 +189,19 @@ def touch_config(fn):
 
 
 class _Config:
+    '''the settings and queries of the config file
+
+    The config file is only read (and logging, the ADS token and the reminder
+    cronjob set up) once any of its settings or queries are first needed.
+    '''
 
     def __getattr__(self, key):
+
+        # Only reached while not yet loaded, as these are then set directly
+        if key in ('settings', 'queries'):
+            self._load()
+            return self.__dict__[key]
+
         try:
             return self.settings[key]
         except KeyError:
@@ -114,36 +218,47 @@ class _Config:
 
         self.config_path = touch_config(config_path)
 
-        with open(self.config_path, 'rb') as oconf:
-            try:
-                self.queries = toml.load(oconf)
-            except toml.TOMLDecodeError as err:
-                raise toml.TOMLDecodeError("Invalid config file") from err
+        self._lock = threading.RLock()
 
-        self.settings = SETTINGS_DEFAULTS | self.queries.pop('Config', {})
+    def _load(self):
 
-        logging.basicConfig(filename=self.settings['log_file'], filemode='w',
-                            level=logging.DEBUG)
+        with self._lock:
 
-        if (api_key := self.settings.get('ads_api_key')) is not None:
-            os.environ['ADS_API_TOKEN'] = api_key
+            if 'settings' in self.__dict__:
+                return
 
-        if self.settings.get('reminder', False) is not False:
+            with open(self.config_path, 'rb') as oconf:
+                try:
+                    queries = toml.load(oconf)
+                except toml.TOMLDecodeError as err:
+                    mssg = "Invalid config file"
+                    raise toml.TOMLDecodeError(mssg) from err
 
-            cron_times = self.settings.get('reminder_times')
+            settings = SETTINGS_DEFAULTS | queries.pop('Config', {})
 
-            logging.info(f'setting up cronjob with {cron_times=}')
+            logging.basicConfig(filename=settings['log_file'], filemode='w',
+                                level=logging.DEBUG)
 
-            if len(cron_times) != 2:
-                mssg = ("Invalid config field 'reminder', must be False or "
-                        "2-array of (0) days of week and (1) hours of day.")
-                raise RuntimeError(mssg)
+            if (api_key := settings.get('ads_api_key')) is not None:
+                os.environ['ADS_API_TOKEN'] = api_key
 
-            setup_cronjob(*cron_times, overwrite=True)
+            if settings.get('reminder', False) is not False:
 
-        else:
-            # If reminder = false, clear any old cronjobs
-            remove_cronjob()
+                cron_times = settings.get('reminder_times')
+
+                if len(cron_times) != 2:
+                    mssg = ("Invalid config field 'reminder', must be False "
+                            "or 2-array of (0) days of week and (1) hours of "
+                            "day.")
+                    raise RuntimeError(mssg)
+
+                sync_cronjob(cron_times)
+
+            else:
+                # If reminder = false, clear any old cronjobs
+                sync_cronjob(None)
+
+            self.queries, self.settings = queries, settings
 
 
 CONFIG = _Config()
@@ -189,26 +304,76 @@ class BidirectionalCycler:
         self._ind, self.N = 0, len(self._saved) - 1
 
 
+def step_date(date, days=1, *, skip_weekends=None):
+    '''move date by a number of days, hopping over weekends if required'''
+
+    if skip_weekends is None:
+        skip_weekends = CONFIG.skip_weekends
+
+    date += datetime.timedelta(days=days)
+
+    if skip_weekends and date.weekday() >= 5:
+        date += datetime.timedelta(days=2 * days)
+
+    return date
+
+
 # --------------------------------------------------------------------------
 # Library helpers
 # --------------------------------------------------------------------------
 
 
-def get_user_libraries():
-    import ads
+def _library_map_store():
+    '''the store holding the cached library map, if caching is enabled'''
+
+    if not CONFIG.cache_results:
+        return None
+
+    return ResultStore(CONFIG.cache_file, ttl=CONFIG.cache_ttl)
+
+
+def get_user_libraries(*, refresh=False):
+    '''map of the names to ids of all the user's libraries
+
+    The map is cached on disk for `library_map_ttl` hours, unless `refresh`.
+    '''
+    import ads.libraries
+    from .connections import get_session
+
+    store = _library_map_store()
+
+    if store is not None and not refresh:
+
+        library_map = store.get_library_map(ttl=CONFIG.library_map_ttl)
+
+        if library_map is not None:
+            return library_map
 
-    q = ads.base.BaseQuery()
     base_url = ads.libraries.Library._libraries_url
 
-    response = q.session.get(base_url).json()['libraries']
+    response = get_session().get(base_url).json()['libraries']
+
+    library_map = {d['name']: d['id'] for d in response}
+
+    if store is not None:
+        store.put_library_map(library_map)
+
+    return library_map
 
-    return {d['name']: d['id'] for d in response}
 
+def invalidate_user_libraries():
+    '''clear the cached library map, so that it is retrieved again'''
 
-def create_default_library(*, name=CONFIG.default_library,
-                           desc="papermate library"):
+    if (store := _library_map_store()) is not None:
+        store.put_library_map({})
+
+
+def create_default_library(*, name=None, desc="papermate library"):
     from ads import libraries
 
+    if name is None:
+        name = CONFIG.default_library
+
     try:
         lib = libraries.Library.new(name=name, description=desc,
                                     public=False, docs=[])
@@ -216,6 +381,9 @@ def create_default_library(*, name=CONFIG.default_library,
         mssg = f"Default library {name} already exists"
         raise ValueError(mssg) from err
 
+    finally:
+        invalidate_user_libraries()
+
     return {name: lib.id}
 
 
@@ -258,28 +426,447 @@ class DateCache(Cache):
         return [datetime.date.fromisoformat(d.strip("z00:00")) for d in self]
 
 
+class DaemonExecutor(concurrent.futures.Executor):
+    '''pool of threads, running submitted calls, which never delays exiting
+
+    Unlike a `ThreadPoolExecutor`, whose workers are joined before exiting
+    (running every call still queued first), the workers are daemon threads,
+    so that anything still running or queued is simply dropped on exit.
+    '''
+
+    def __init__(self, max_workers=1):
+
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+        self._threads = [threading.Thread(target=self._work, daemon=True)
+                         for _ in range(max_workers)]
+
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        '''run queued calls, until given None'''
+
+        while (item := self._queue.get()) is not None:
+
+            future, func, args, kwargs = item
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = func(*args, **kwargs)
+
+            except BaseException as err:
+                future.set_exception(err)
+
+            else:
+                future.set_result(result)
+
+    def submit(self, func, /, *args, **kwargs):
+
+        with self._lock:
+
+            if self._shutdown:
+                mssg = 'cannot schedule new futures after shutdown'
+                raise RuntimeError(mssg)
+
+            future = concurrent.futures.Future()
+            self._queue.put((future, func, args, kwargs))
+
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+
+        with self._lock:
+
+            self._shutdown = True
+
+            if cancel_futures:
+                while True:
+
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    if item is not None:
+                        item[0].cancel()
+
+            for _ in self._threads:
+                self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class Prefetcher:
+    '''fetch items into a cache on background threads
+
+    `func` is called with each key on a worker thread, and the result is
+    stored in `cache` once it finishes successfully. Asking for a key which is
+    already being fetched returns the same in-flight future, rather than
+    starting another fetch.
+
+    The workers are daemon threads (see `DaemonExecutor`), so that exiting
+    never waits on any fetch still running, or queued.
+    '''
+
+    def __init__(self, func, cache, *, max_workers=1):
+
+        self.func = func
+        self.cache = cache
+
+        self._pool = DaemonExecutor(max_workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, key):
+
+        try:
+            result = self.func(key)
+            self.cache.cache_results(key, result)
+
+        except Exception as err:
+            logging.warning(f'failed to fetch {key=}: {err}')
+            raise
+
+        finally:
+            with self._lock:
+                self._pending.pop(self.cache._coerce_id(key), None)
+
+        return result
+
+    def fetch(self, key):
+        '''return a future of the result for `key`, fetching it if needed'''
+
+        id_ = self.cache._coerce_id(key)
+
+        with self._lock:
+
+            if key in self.cache:
+                future = concurrent.futures.Future()
+                future.set_result(self.cache[key])
+
+            elif (future := self._pending.get(id_)) is None:
+                future = self._pool.submit(self._fetch, key)
+                self._pending[id_] = future
+
+        return future
+
+    def prefetch(self, keys):
+        '''start fetching, in the background, any of these keys not cached'''
+        return [self.fetch(key) for key in keys if key not in self.cache]
+
+    def close(self):
+        '''cancel all fetches not yet started, and stop the workers'''
+
+        with self._lock:
+            self._pending.clear()
+
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ResultStore:
+    '''persistent on-disk store of raw query results (the solr documents)
+
+    Results are stored in a small SQLite database, keyed on a query and the
+    entry date searched for, and are considered expired after `ttl` hours.
+    Results of the current day (or later) are never stored, as articles may
+    still be added to them. A new connection is opened for each operation, so
+    a single store can be shared between the threads executing queries.
+
+    The documents of libraries are also stored, and are instead considered
+    expired as soon as the library's metadata (number of documents or date
+    last modified) no longer matches that stored alongside them.
+    '''
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS results ("
+        "query TEXT NOT NULL, entdate TEXT NOT NULL, "
+        "stored REAL NOT NULL, docs TEXT NOT NULL, "
+        "PRIMARY KEY (query, entdate))",
+        "CREATE TABLE IF NOT EXISTS libraries ("
+        "library TEXT PRIMARY KEY, num_documents INTEGER, modified TEXT, "
+        "stored REAL NOT NULL, docs TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS library_map ("
+        "name TEXT PRIMARY KEY, id TEXT NOT NULL, stored REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS memberships ("
+        "bibcode TEXT NOT NULL, library TEXT NOT NULL, name TEXT, "
+        "PRIMARY KEY (bibcode, library))"
+    )
+
+    def __repr__(self):
+        return f"ResultStore(filename={self.filename}, ttl={self.ttl})"
+
+    def __init__(self, filename, ttl=24):
+
+        self.filename = pathlib.Path(filename)
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+
+        # ttl in hours
+        self.ttl = ttl
+
+        with self._connect() as conn:
+            for table in self._schema:
+                conn.execute(table)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        '''open a connection, commit on success and always close it'''
+
+        conn = sqlite3.connect(self.filename, timeout=10)
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _is_current(entdate):
+        '''whether this entry date is today (or later), and so not final'''
+        return entdate[:10] >= f'{datetime.date.today():%Y-%m-%d}'
+
+    def get(self, query, entdate):
+        '''return the stored documents of this query and date, or None'''
+
+        if self._is_current(entdate):
+            return None
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT stored, docs FROM results "
+                "WHERE query = ? AND entdate = ?", (query, entdate)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        stored, docs = row
+
+        if time.time() - stored > self.ttl * 3600:
+            logging.info(f'stored results for {entdate=} have expired')
+            return None
+
+        return json.loads(docs)
+
+    def put(self, query, entdate, docs):
+        '''store the documents of this query and date, replacing old ones'''
+
+        if self._is_current(entdate):
+            logging.info(f'not storing results of current {entdate=}')
+            return
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (query, entdate, time.time(), json.dumps(docs))
+            )
+
+    def get_library(self, library, metadata):
+        '''return the stored documents of this library, if still up to date'''
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT num_documents, modified, docs FROM libraries "
+                "WHERE library = ?", (library,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        Ndocs, modified, docs = row
+
+        if (Ndocs != metadata.get('num_documents')
+                or modified != metadata.get('date_last_modified')):
+            logging.info(f'stored documents of {library=} are out of date')
+            return None
+
+        return json.loads(docs)
+
+    def put_library(self, library, metadata, docs):
+        '''store the documents of this library, along with its metadata'''
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO libraries VALUES (?, ?, ?, ?, ?)",
+                (library, metadata.get('num_documents'),
+                 metadata.get('date_last_modified'), time.time(),
+                 json.dumps(docs))
+            )
+
+    def get_library_map(self, ttl):
+        '''return the stored map of library names to ids, if not expired'''
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, id, stored FROM library_map"
+            ).fetchall()
+
+        if not rows or any(time.time() - stored > ttl * 3600
+                           for *_, stored in rows):
+            return None
+
+        return {name: id_ for name, id_, _ in rows}
+
+    def put_library_map(self, library_map):
+        '''store the map of library names to ids, replacing the old map'''
+
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM library_map")
+            conn.executemany(
+                "INSERT INTO library_map VALUES (?, ?, ?)",
+                [(name, id_, now) for name, id_ in library_map.items()]
+            )
+
+    def get_memberships(self):
+        '''return all stored (bibcode, library, name) library memberships'''
+
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT bibcode, library, name FROM memberships"
+            ).fetchall()
+
+    def put_memberships(self, library, name, bibcodes, *, replace=False):
+        '''store the bibcodes contained in this library
+
+        if `replace`, these replace all bibcodes previously stored for it
+        '''
+
+        with self._connect() as conn:
+
+            if replace:
+                conn.execute("DELETE FROM memberships WHERE library = ?",
+                             (library,))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO memberships VALUES (?, ?, ?)",
+                [(bibcode, library, name) for bibcode in bibcodes]
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM libraries")
+            conn.execute("DELETE FROM library_map")
+            conn.execute("DELETE FROM memberships")
+
+
 class _ReadMarkers:
+    '''dates which have been marked as read, stored in `location`
+
+    The marker file (in `download_location` by default) is only created once
+    first used. All markers are read into memory once, so that lookups do not
+    touch the file at all. Marking a date merges in any markers written by
+    other processes, under a file lock, and atomically rewrites the file
+    without duplicates.
+    '''
+
+    _basename = '.papermate_readmarker.txt'
+
+    @property
+    def filename(self):
+
+        if self._filename is None:
+
+            location = self._location
+            if location is None:
+                location = CONFIG.download_location
+
+            self._filename = pathlib.Path(location) / self._basename
+
+            self._filename.touch(exist_ok=True)
+
+        return self._filename
+
+    @property
+    def markers(self):
+
+        if self._markers is None:
+
+            with self._lock:
+
+                if self._markers is None:
+
+                    markers, Nlines = self._read()
+
+                    # Compact any duplicates left by older versions
+                    if Nlines > len(markers):
+                        with self._file_lock():
+                            markers, _ = self._read()
+                            self._write(markers)
+
+                    self._markers = markers
+
+        return self._markers
 
     def _coerce_date(self, date):
         return f'{date:%Y-%m-%d}z00:00'
 
-    def __contains__(self, date):
+    def _read(self):
+        '''all markers in the file, and the number of lines they take'''
 
         with open(self.filename, 'r') as of:
+            lines = [ln.strip() for ln in of if ln.strip()]
+
+        return set(lines), len(lines)
+
+    def _write(self, markers):
+        '''atomically replace the file with these (sorted) markers'''
+
+        tmp = self.filename.with_name(f'{self._basename}.{os.getpid()}.tmp')
+
+        with open(tmp, 'w') as of:
+            of.writelines(f'{marker}\n' for marker in sorted(markers))
 
-            return self._coerce_date(date) in (ln.strip() for ln in of)
+        os.replace(tmp, self.filename)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        '''exclusive lock on the marker file, across processes'''
+
+        lockfile = self.filename.with_name(f'{self._basename}.lock')
+
+        with open(lockfile, 'a') as lf:
+
+            fcntl.flock(lf, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def __contains__(self, date):
+        return self._coerce_date(date) in self.markers
 
     def mark(self, date):
 
-        with open(self.filename, 'a') as of:
+        marker = self._coerce_date(date)
+
+        if marker in self.markers:
+            return
+
+        with self._lock, self._file_lock():
+
+            markers, _ = self._read()
 
-            of.write(self._coerce_date(date) + '\n')
+            markers |= self._markers
+            markers.add(marker)
 
-    def __init__(self, location=CONFIG.download_location):
+            self._write(markers)
 
-        self.filename = pathlib.Path(location) / '.papermate_readmarker.txt'
+            self._markers = markers
 
-        self.filename.touch(exist_ok=True)
+    def __init__(self, location=None):
+        self._location, self._filename = location, None
+        self._markers = None
+        self._lock = threading.Lock()
 
 
 READMARKERS = _ReadMarkers()